@@ -0,0 +1,148 @@
+# backend/cold_start.py
+"""
+Precomputed ranking for users without history.
+
+For a new user the CF tower carries no signal, so scoring the whole
+catalog per request only to discard the result is wasted work.
+`ColdStartTable` is built once per (dataset, model) version from:
+
+• popularity  – interaction count per item
+• click-rate  – smoothed clicks / impressions per item
+• content     – fusion head fed only the `ContentTower` output (CF part
+                zeroed), i.e. what the model thinks of the item's meta
+
+A new-user request is then an O(K) walk down a pre-sorted array, optionally
+restricted to one category.
+"""
+
+from __future__ import annotations
+import time
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+import pandas as pd
+import torch
+
+
+def _rank01(x: np.ndarray) -> np.ndarray:
+    """Rank-normalise to [0, 1] so differently scaled signals can be blended."""
+    if len(x) < 2:
+        return np.ones_like(x, dtype=np.float32)
+    r = np.empty(len(x), dtype=np.float32)
+    r[np.argsort(x, kind="stable")] = np.arange(len(x), dtype=np.float32)
+    return r / (len(x) - 1)
+
+
+@torch.no_grad()
+def content_scores(model, meta: np.ndarray, batch_size: int = 4096) -> np.ndarray:
+    """Sigmoid of the fusion head with only the content tower switched on."""
+    device = next(model.parameters()).device
+    model.eval()
+    out = np.empty(len(meta), dtype=np.float32)
+    for s in range(0, len(meta), batch_size):
+        m = torch.as_tensor(meta[s:s + batch_size], dtype=torch.float32, device=device)
+        cb = model.cb(m)
+        cf = torch.zeros(len(m), model.cf_dim, device=device)
+        logits = model.out(torch.cat([cf, cb], dim=1)).squeeze(1)
+        out[s:s + len(m)] = torch.sigmoid(logits).cpu().numpy()
+    return out
+
+
+class ColdStartTable:
+    def __init__(self,
+                 order:       np.ndarray,
+                 scores:      Dict[str, np.ndarray],
+                 by_category: Dict[int, np.ndarray],
+                 i2asin:      Dict[int, str],
+                 i2title:     Dict[int, str],
+                 known_users: frozenset,
+                 version:     str):
+        self.order       = order          # item ids, best first
+        self.scores      = scores         # name → [n_items] (indexed by i_idx)
+        self.by_category = by_category    # category → item ids, best first
+        self.i2asin      = i2asin
+        self.i2title     = i2title
+        self.known_users = known_users    # u_idx with history at build time
+        self.version     = version
+        self.built_at    = time.time()
+
+    # --------------------------------------------------------------------- #
+    @classmethod
+    def build(cls,
+              df:      pd.DataFrame,
+              model,
+              store,
+              version: str = "base",
+              weights: Dict[str, float] = None,
+              category_col: str = "category_encoded",
+              prior_strength: float = 10.0) -> "ColdStartTable":
+        """
+        `store` is a `FeatureStore` (item meta by i_idx). `weights` blends
+        the rank-normalised signals; defaults favour the model's content score.
+        """
+        weights = weights or {"popularity": 0.3, "click_rate": 0.3, "content": 0.4}
+        t0 = time.perf_counter()
+        n_items = int(df["i_idx"].max()) + 1
+        items   = df["i_idx"].to_numpy()
+
+        counts = np.bincount(items, minlength=n_items).astype(np.float32)
+        clicks = np.bincount(items, weights=df["click"].to_numpy(dtype=np.float32),
+                             minlength=n_items).astype(np.float32)
+        prior  = clicks.sum() / max(counts.sum(), 1.0)
+        ctr    = (clicks + prior_strength * prior) / (counts + prior_strength)
+
+        present = np.flatnonzero(counts > 0)
+        content = np.zeros(n_items, dtype=np.float32)
+        content[present] = content_scores(model, store.item_meta(present))
+
+        scores = {"popularity": counts, "click_rate": ctr, "content": content}
+        blend  = np.zeros(n_items, dtype=np.float32)
+        for name, w in weights.items():
+            blend[present] += w * _rank01(scores[name][present])
+        scores["final"] = blend
+
+        order = present[np.argsort(-blend[present], kind="stable")]
+
+        by_category: Dict[int, np.ndarray] = {}
+        if category_col in df.columns:
+            cat = df.groupby("i_idx")[category_col].last()
+            cat_of = cat.reindex(order).to_numpy()
+            for c in pd.unique(cat_of):
+                by_category[int(c)] = order[cat_of == c]    # keeps global order
+
+        last = lambda col: (df.groupby("i_idx")[col].last().to_dict()
+                            if col in df.columns else {})
+        i2asin, i2title = last("product_id"), last("product_title")
+
+        known = frozenset(int(u) for u in df["u_idx"].unique())
+        table = cls(order, scores, by_category, i2asin, i2title, known, version)
+        print(f"[cold-start] {version}: {len(order)} items, "
+              f"{len(by_category)} categories in {time.perf_counter()-t0:.2f}s")
+        return table
+
+    # --------------------------------------------------------------------- #
+    def is_new(self, user_id: int) -> bool:
+        return int(user_id) not in self.known_users
+
+    def top_k(self, k: int, category: Optional[int] = None,
+              exclude: Iterable[int] = ()) -> List[dict]:
+        """Best `k` items (same record shape as `hybrid_topk_recommendation`)."""
+        ranked = self.order if category is None else self.by_category.get(category, self.order[:0])
+        exclude = set(exclude)
+        recs = []
+        for item_id in ranked:
+            if len(recs) >= k:
+                break
+            item_id = int(item_id)
+            if item_id in exclude:
+                continue
+            recs.append({
+                'item_id': item_id,
+                'asin': self.i2asin.get(item_id, "Unknown"),
+                'title': self.i2title.get(item_id, "Unknown Title"),
+                'deepfm_score': round(float(self.scores["content"][item_id]), 4),
+                'knn_score': 0.0,
+                'final_score': round(float(self.scores["final"][item_id]), 4),
+                'top5_related_past_titles': []
+            })
+        return recs
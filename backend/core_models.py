@@ -1,8 +1,10 @@
 # backend/core_models.py  – load once
+import os, tempfile
 import torch, nltk
 from sentence_transformers import SentenceTransformer
 from nltk.sentiment import SentimentIntensityAnalyzer
-from backend.model import HybridDeepFM
+from backend.model import HybridDeepFM, EMB_TABLES, cached_embedding_tables
+from backend.text_embedding import EmbeddingPipeline
 from pathlib import Path    
 
 nltk.download("vader_lexicon")
@@ -10,6 +12,8 @@ nltk.download("vader_lexicon")
 DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
 EMBEDDER = SentenceTransformer("all-mpnet-base-v2", device=DEVICE)
 SENTIMENT = SentimentIntensityAnalyzer()
+# one pipeline for every /preprocess: worker pools / quantised copies built once
+EMBED_PIPELINE = EmbeddingPipeline.from_env(EMBEDDER)
 
 HERE = Path(__file__).resolve().parent   # …/backend
 CKPT_PATH = HERE / "new_dien.pth"        # …/backend/new_dien.pth
@@ -24,8 +28,23 @@ emb_dim   = ckpt["cf.user_emb.weight"].shape[1]
 hidden_dim= ckpt["cb.fc.0.weight"].shape[0]
 seq_len   = 50   # set manually if you changed it
 
+# CF id-table storage: dense | fp16 | int8 | mmap  (qr needs retraining)
+EMB_BACKEND = os.getenv("RECOAI_EMB_BACKEND", "dense")
+if EMB_BACKEND == "qr":
+    # QR tables cannot be converted from the dense checkpoint, and /fine_tune
+    # keeps the CF tower frozen, so they would be served untrained.
+    raise RuntimeError("RECOAI_EMB_BACKEND=qr is not servable from a dense "
+                       "checkpoint; use dense, fp16, int8 or mmap")
+# mmap tables are exported once per checkpoint *content*, outside the source tree
+EMB_CACHE = Path(os.getenv("RECOAI_EMB_CACHE")
+                 or Path(tempfile.gettempdir()) / "recoai_emb_tables")
+emb_kw = {}
+if EMB_BACKEND == "mmap":
+    emb_kw["mmap_dir"] = cached_embedding_tables(ckpt, CKPT_PATH, EMB_CACHE)
+
 model = HybridDeepFM(
-    n_users, n_items, emb_dim, meta_dim, hidden_dim, seq_len
+    n_users, n_items, emb_dim, meta_dim, hidden_dim, seq_len,
+    emb_backend=EMB_BACKEND, **emb_kw
 ).to(DEVICE)
 
 # (Optional) rename keys if you changed the layer name
@@ -33,8 +52,17 @@ if "cf.final_layer.weight" in ckpt:
     ckpt["cf.aux_linear.weight"] = ckpt.pop("cf.final_layer.weight")
     ckpt["cf.aux_linear.bias"]   = ckpt.pop("cf.final_layer.bias")
 
-model.load_state_dict(ckpt, strict=False)
+missing, _ = model.load_state_dict(ckpt, strict=False)
+missing_cf = [k for k in missing if k.startswith("cf.")]
+if missing_cf:
+    raise RuntimeError(f"{CKPT_PATH.name}: no weights for {missing_cf} "
+                       f"with RECOAI_EMB_BACKEND={EMB_BACKEND}")
 model.eval()
 
+# compact backends hold their own copy – don't keep the dense one around too
+if EMB_BACKEND != "dense":
+    for name in EMB_TABLES:
+        ckpt.pop(f"cf.{name}.weight", None)
+
 BASE_MODEL = model
 CKPT       = ckpt
\ No newline at end of file
@@ -0,0 +1,216 @@
+# backend/distributed.py
+"""
+Optional multi-process data-parallel fine-tuning on CPU.
+
+`fine_tune_distributed` spawns N local workers (gloo backend) that each
+train a `DistributedDataParallel` replica on their shard of the class-
+balanced sample stream.  Validation is sharded too; predictions are
+gathered on rank 0 for a single global AUC.  Only rank 0 keeps the best
+weights, written to a temp file the parent process reads back.
+
+Throughput scaling across worker counts:
+
+    python -m backend.distributed --ckpt backend/new_dien.pth \\
+        --data preprocessed_data.csv --workers 1 2 4 --epochs 1 --out scaling.json
+"""
+
+from __future__ import annotations
+import argparse, inspect, json, os, socket, tempfile, time
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+import torch
+import torch.distributed as dist
+import torch.multiprocessing as mp
+from torch.nn.parallel import DistributedDataParallel as DDP
+from torch.utils.data import Sampler, Subset
+from sklearn.metrics import roc_auc_score
+
+from backend.training import (batched_loader, class_balance_weights, predict,
+                              train_epoch, trainable_state)
+
+# Buffers are not synced every forward: with fp16 / int8 CF tables the whole
+# id tables are buffers, and the only others are BatchNorm stats (rank 0's
+# are the ones kept).  Newer torch renamed the switch.
+_NO_BUFFER_SYNC = ({"forward_sync_buffers": False}
+                   if "forward_sync_buffers" in inspect.signature(DDP).parameters
+                   else {"broadcast_buffers": False})
+
+
+class ShardedWeightedSampler(Sampler):
+    """
+    Class-balanced sampling split across ranks.
+
+    Every rank draws the *same* global weighted sample (seeded by epoch) and
+    keeps every `world_size`-th index, so the union over ranks matches what
+    a single `WeightedRandomSampler` would produce.
+    """
+    def __init__(self, weights: np.ndarray, rank: int, world_size: int, seed: int = 42):
+        self.weights    = torch.as_tensor(weights, dtype=torch.double)
+        self.rank       = rank
+        self.world_size = world_size
+        self.seed       = seed
+        self.epoch      = 0
+        self.num_samples = len(self.weights) // world_size
+
+    def set_epoch(self, epoch: int) -> None:
+        self.epoch = epoch
+
+    def __iter__(self):
+        g = torch.Generator(); g.manual_seed(self.seed + self.epoch)
+        total = self.num_samples * self.world_size
+        idx = torch.multinomial(self.weights, total, replacement=True, generator=g)
+        return iter(idx[self.rank::self.world_size].tolist())
+
+    def __len__(self): return self.num_samples
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _worker(rank: int, world_size: int, port: int, model, tr_ds, vl_ds,
+            train_labels, cfg: dict, out_path: str):
+    dist.init_process_group("gloo", init_method=f"tcp://127.0.0.1:{port}",
+                            rank=rank, world_size=world_size)
+    torch.set_num_threads(cfg["threads"])
+    torch.manual_seed(cfg["seed"])
+    try:
+        device = torch.device("cpu")
+        ddp = DDP(model.to(device), **_NO_BUFFER_SYNC)
+        sampler = ShardedWeightedSampler(class_balance_weights(train_labels),
+                                         rank, world_size, cfg["seed"])
+        tl = batched_loader(tr_ds, cfg["batch_size"], sampler)
+        vl = batched_loader(Subset(vl_ds, list(range(rank, len(vl_ds), world_size))),
+                            cfg["batch_size"])
+
+        opt  = torch.optim.Adam(filter(lambda p: p.requires_grad, ddp.parameters()),
+                                lr=cfg["lr"])
+        crit = torch.nn.BCEWithLogitsLoss()
+
+        best_auc, best_state, epochs_log = 0.0, None, []
+        for ep in range(cfg["epochs"]):
+            sampler.set_epoch(ep)
+            dist.barrier()
+            t0 = time.perf_counter()
+            loss, seen = train_epoch(ddp, tl, opt, crit, device, cfg["aux_weight"])
+            dt = time.perf_counter() - t0
+
+            stats = torch.tensor([loss, float(seen)], dtype=torch.double)
+            dist.all_reduce(stats, op=dist.ReduceOp.SUM)
+            dt_max = torch.tensor([dt], dtype=torch.double)
+            dist.all_reduce(dt_max, op=dist.ReduceOp.MAX)
+
+            shard = predict(ddp.module, vl, device)
+            gathered: List[Optional[Tuple[np.ndarray, np.ndarray]]] = \
+                [None] * world_size if rank == 0 else None
+            dist.gather_object(shard, gathered, dst=0)
+
+            if rank == 0:
+                yt = np.concatenate([g[0] for g in gathered])
+                yp = np.concatenate([g[1] for g in gathered])
+                auc = roc_auc_score(yt, yp)
+                sps = stats[1].item() / dt_max.item()
+                epochs_log.append({"epoch": ep + 1, "auc": auc,
+                                   "loss": stats[0].item() / world_size,
+                                   "samples_per_sec": sps})
+                print(f"[{cfg['tag']}] ep {ep+1}/{cfg['epochs']} "
+                      f"loss {stats[0].item()/world_size:.4f}  auc {auc:.4f}  "
+                      f"{sps:,.0f} samples/s ({world_size} workers)")
+                if auc > best_auc:
+                    best_auc, best_state = auc, trainable_state(ddp.module)
+
+        if rank == 0:
+            torch.save({"state": best_state, "auc": best_auc,
+                        "epochs": epochs_log}, out_path)
+    finally:
+        dist.destroy_process_group()
+
+
+def fine_tune_distributed(model,
+                          tr_ds,
+                          vl_ds,
+                          train_labels: np.ndarray,
+                          world_size:  int,
+                          epochs:      int,
+                          lr:          float,
+                          batch_size:  int,
+                          aux_weight:  float,
+                          threads_per_worker: Optional[int] = None,
+                          seed:        int = 42,
+                          tag:         str = "ddp") -> Dict:
+    """
+    Run data-parallel fine-tuning in `world_size` local CPU processes.
+
+    Returns {"state": best trainable state, "auc": best AUC,
+             "epochs": per-epoch loss / AUC / samples-per-sec}.
+    `batch_size` is per worker, so the effective batch is world_size×.
+    """
+    if threads_per_worker is None:
+        threads_per_worker = max(1, (os.cpu_count() or 1) // world_size)
+    cfg = dict(epochs=epochs, lr=lr, batch_size=batch_size, aux_weight=aux_weight,
+               threads=threads_per_worker, seed=seed, tag=tag)
+
+    with tempfile.TemporaryDirectory(prefix="recoai_ddp_") as tmp:
+        out_path = str(Path(tmp) / "best.pth")
+        mp.spawn(_worker,
+                 args=(world_size, _free_port(), model, tr_ds, vl_ds,
+                       np.asarray(train_labels), cfg, out_path),
+                 nprocs=world_size, join=True)
+        return torch.load(out_path)
+
+
+def scaling_report(model,
+                   tr_ds,
+                   vl_ds,
+                   train_labels: np.ndarray,
+                   worker_counts: Iterable[int] = (1, 2, 4),
+                   epochs:       int = 1,
+                   lr:           float = 3e-5,
+                   batch_size:   int = 512,
+                   aux_weight:   float = 0.65) -> List[Dict]:
+    """
+    Train for `epochs` at each worker count and report throughput relative
+    to one worker. Cores are split evenly between workers.
+    """
+    rows, base = [], None
+    for n in worker_counts:
+        res = fine_tune_distributed(model, tr_ds, vl_ds, train_labels, n,
+                                    epochs, lr, batch_size, aux_weight,
+                                    tag=f"scale-{n}")
+        sps = float(np.mean([e["samples_per_sec"] for e in res["epochs"]]))
+        base = base or sps
+        rows.append({"workers": n, "samples_per_sec": sps,
+                     "speedup": sps / base, "efficiency": sps / base / n,
+                     "auc": res["auc"]})
+        print(f"[scaling] {n} workers: {sps:,.0f} samples/s  "
+              f"×{sps/base:.2f}  ({100*sps/base/n:.0f}% efficiency)")
+    return rows
+
+
+if __name__ == "__main__":
+    from backend.embedding_bench import _dims, _load_split
+    from backend.model import HybridDeepFM
+
+    ap = argparse.ArgumentParser(description="Data-parallel fine-tune throughput scaling.")
+    ap.add_argument("--ckpt", type=Path, default=Path(__file__).parent / "new_dien.pth")
+    ap.add_argument("--data", type=Path, default=Path("preprocessed_data.csv"))
+    ap.add_argument("--emb-dir", type=Path, default=Path("."))
+    ap.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    ap.add_argument("--epochs", type=int, default=1)
+    ap.add_argument("--batch-size", type=int, default=512)
+    ap.add_argument("--out", type=Path)
+    args = ap.parse_args()
+
+    ckpt = torch.load(args.ckpt, map_location="cpu")
+    tr_ds, yt, vl_ds = _load_split(args.data, args.emb_dir, _dims(ckpt)["meta_dim"])
+    model = HybridDeepFM(**_dims(ckpt))
+    model.load_state_dict(ckpt, strict=False)
+    for p in model.cf.parameters(): p.requires_grad = False     # as /fine_tune
+    rows = scaling_report(model, tr_ds, vl_ds, yt, args.workers, args.epochs,
+                          batch_size=args.batch_size)
+    if args.out:
+        args.out.write_text(json.dumps(rows, indent=2))
@@ -0,0 +1,118 @@
+# backend/embedding_bench.py
+"""
+Memory / AUC trade-off of the CF embedding backends in `backend.model`.
+
+    python -m backend.embedding_bench --ckpt backend/new_dien.pth \\
+        --data preprocessed_data.csv --backends dense fp16 int8 mmap qr
+
+Each backend is built from the same checkpoint; AUC is measured on a
+held-out split of `--data` (needs the matching `*_embeddings.npy` files).
+`qr` cannot be converted from dense tables, so its AUC is only meaningful
+when `--qr-epochs` > 0 retrains the CF tower.
+"""
+
+from __future__ import annotations
+import argparse, ast, json, tempfile, time
+from pathlib import Path
+from typing import Dict, Iterable, List
+
+import numpy as np
+import pandas as pd
+import torch
+from sklearn.metrics import roc_auc_score
+from sklearn.model_selection import train_test_split
+
+from backend.model import (EMB_TABLES, HybridDeepFM, MemmapEmbedding,
+                           export_embedding_tables)
+from backend.training import (META_COLS, RecommenderDataset, balanced_loader,
+                              batched_loader, build_meta_matrix, predict,
+                              train_epoch)
+
+
+def table_bytes(model: HybridDeepFM) -> Dict[str, int]:
+    """Resident and on-disk bytes of the four CF id tables."""
+    resident, on_disk = 0, 0
+    for name in EMB_TABLES:
+        emb = getattr(model.cf, name)
+        if isinstance(emb, MemmapEmbedding):
+            on_disk += Path(emb.path).stat().st_size
+            continue
+        for t in list(emb.parameters()) + list(emb.buffers()):
+            resident += t.numel() * t.element_size()
+    return {"resident_bytes": resident, "mmap_bytes": on_disk}
+
+
+def _dims(ckpt: dict) -> dict:
+    return dict(n_users    = ckpt["cf.user_emb.weight"].shape[0],
+                n_items    = ckpt["cf.item_emb.weight"].shape[0] - 1,
+                emb_dim    = ckpt["cf.user_emb.weight"].shape[1],
+                meta_dim   = ckpt["cb.fc.0.weight"].shape[1],
+                hidden_dim = ckpt["cb.fc.0.weight"].shape[0])
+
+
+def benchmark_backends(ckpt:      dict,
+                       val_ds:    RecommenderDataset,
+                       backends:  Iterable[str] = ("dense", "fp16", "int8", "mmap", "qr"),
+                       train_ds:  RecommenderDataset | None = None,
+                       train_labels: np.ndarray | None = None,
+                       qr_epochs: int = 0,
+                       batch_size: int = 512) -> List[Dict]:
+    dims = _dims(ckpt)
+    vl = batched_loader(val_ds, batch_size)
+    rows = []
+    with tempfile.TemporaryDirectory(prefix="recoai_emb_") as tmp:
+        mmap_dir = export_embedding_tables(ckpt, tmp)
+        for backend in backends:
+            kw = {"mmap_dir": mmap_dir} if backend == "mmap" else {}
+            model = HybridDeepFM(**dims, emb_backend=backend, **kw)
+            model.load_state_dict(ckpt, strict=False)
+
+            if backend == "qr" and qr_epochs and train_ds is not None:
+                opt  = torch.optim.Adam(model.parameters(), lr=1e-3)
+                crit = torch.nn.BCEWithLogitsLoss()
+                tl   = balanced_loader(train_ds, train_labels, batch_size)
+                for _ in range(qr_epochs):
+                    train_epoch(model, tl, opt, crit, "cpu", 0.65)
+
+            t0 = time.perf_counter()
+            yt, yp = predict(model, vl, "cpu")
+            dt = time.perf_counter() - t0
+            row = {"backend": backend, **table_bytes(model),
+                   "auc": float(roc_auc_score(yt, yp)) if len(set(yt)) > 1 else None,
+                   "rows_per_sec": len(yt) / dt}
+            rows.append(row)
+            print(f"[emb-bench] {backend:5s}  resident {row['resident_bytes']/2**20:8.1f} MiB  "
+                  f"mmap {row['mmap_bytes']/2**20:8.1f} MiB  auc {row['auc']}  "
+                  f"{row['rows_per_sec']:,.0f} rows/s")
+    return rows
+
+
+def _load_split(data: Path, emb_dir: Path, meta_dim: int):
+    df = pd.read_csv(data)
+    df["seq"] = df["seq"].apply(ast.literal_eval)
+    emb = {k: np.load(emb_dir / f"{k}_embeddings.npy")
+           for k in ("review", "features", "product_title")
+           if (emb_dir / f"{k}_embeddings.npy").exists()}
+    X = build_meta_matrix(df, emb, [c for c in META_COLS if c in df.columns])
+    if X.shape[1] != meta_dim:
+        raise SystemExit(f"meta dim {X.shape[1]} != checkpoint {meta_dim}")
+    y = df["click"].values
+    dft, dfv, yt, yv, Xt, Xv = train_test_split(df, y, X, test_size=0.2, random_state=42)
+    return RecommenderDataset(dft, Xt, yt), yt, RecommenderDataset(dfv, Xv, yv)
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    ap.add_argument("--ckpt", type=Path, default=Path(__file__).parent / "new_dien.pth")
+    ap.add_argument("--data", type=Path, default=Path("preprocessed_data.csv"))
+    ap.add_argument("--emb-dir", type=Path, default=Path("."))
+    ap.add_argument("--backends", nargs="+", default=["dense", "fp16", "int8", "mmap", "qr"])
+    ap.add_argument("--qr-epochs", type=int, default=0)
+    ap.add_argument("--out", type=Path)
+    args = ap.parse_args()
+
+    ckpt = torch.load(args.ckpt, map_location="cpu")
+    tr_ds, yt, vl_ds = _load_split(args.data, args.emb_dir, _dims(ckpt)["meta_dim"])
+    rows = benchmark_backends(ckpt, vl_ds, args.backends, tr_ds, yt, args.qr_epochs)
+    if args.out:
+        args.out.write_text(json.dumps(rows, indent=2))
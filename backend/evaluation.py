@@ -0,0 +1,240 @@
+# backend/evaluation.py
+"""
+Batched offline ranking evaluation.
+
+Scores many held-out users against their candidate sets in large
+vectorised batches and folds the results into streaming accumulators, so
+memory stays bounded by the batch size rather than the number of users.
+
+    train, test = leave_last_out_split(df)
+    hist  = build_histories(train, seq_len=50, pad_token=df.i_idx.max() + 1)
+    store = train_feature_store(df, train, emb, struct_cols)
+    metrics = evaluate_ranking(model, hist, test, store, ks=(5, 10, 20))
+
+The feature store must come from the training rows only: item meta uses
+each item's latest interaction for row-level blocks (review embedding,
+sentiment), which for a held-out item is often the held-out row itself.
+The candidate catalog is therefore the items seen in training.
+
+Metrics: recall@K, NDCG@K, hit-rate@K and catalog coverage@K.
+"""
+
+from __future__ import annotations
+import time
+from typing import Dict, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+import pandas as pd
+import torch
+
+from backend.feature_store import FeatureStore
+
+
+# ────────────────────────────────────────────────────────────────────────────
+#  Splitting
+# ────────────────────────────────────────────────────────────────────────────
+
+def leave_last_out_split(df: pd.DataFrame,
+                         n_holdout: int = 1,
+                         positive_col: str = "click") -> Tuple[pd.DataFrame, Dict[int, Set[int]]]:
+    """
+    Hold out each user's last `n_holdout` positive interactions (row order
+    is taken as time order, as in `Preprocessing`'s sequences).
+    Returns (train rows, {u_idx: held-out item set}). Users left with no
+    training rows have no history; `evaluate_ranking` skips them (they are
+    cold-start users) and reports how many.
+    """
+    pos = df[df[positive_col] > 0]
+    rank_from_end = pos.groupby("u_idx").cumcount(ascending=False)
+    held = pos[rank_from_end < n_holdout]
+    train = df.drop(index=held.index)
+    test = held.groupby("u_idx")["i_idx"].agg(lambda s: set(s.tolist())).to_dict()
+    return train, test
+
+
+def build_histories(train: pd.DataFrame, seq_len: int, pad_token: int) -> Dict[int, np.ndarray]:
+    """Left-padded last-`seq_len` item history per user from training rows only."""
+    hist = {}
+    for u, items in train.groupby("u_idx")["i_idx"]:
+        seq = items.to_numpy()[-seq_len:]
+        out = np.full(seq_len, pad_token, dtype=np.int64)
+        out[seq_len - len(seq):] = seq
+        hist[int(u)] = out
+    return hist
+
+
+def train_feature_store(df: pd.DataFrame, train: pd.DataFrame,
+                        emb: Dict[str, np.ndarray], struct_cols: List[str]) -> FeatureStore:
+    """`FeatureStore` over `train` only; `emb` arrays are row-aligned with `df`."""
+    rows = df.index.get_indexer(train.index)
+    return FeatureStore.from_frame(train, {k: v[rows] for k, v in emb.items()}, struct_cols)
+
+
+# ────────────────────────────────────────────────────────────────────────────
+#  Streaming metrics
+# ────────────────────────────────────────────────────────────────────────────
+
+class RankingMetrics:
+    """Running sums of per-user metrics; O(n_items) memory for coverage."""
+
+    def __init__(self, ks: Sequence[int], n_items: int):
+        self.ks      = sorted(ks)
+        self.users   = 0
+        self.recall  = {k: 0.0 for k in self.ks}
+        self.ndcg    = {k: 0.0 for k in self.ks}
+        self.hits    = {k: 0.0 for k in self.ks}
+        self.covered = {k: np.zeros(n_items, dtype=bool) for k in self.ks}
+        kmax = self.ks[-1]
+        self._disc = 1.0 / np.log2(np.arange(2, kmax + 2))       # [Kmax]
+        self._idcg = np.cumsum(self._disc)                         # ideal DCG by |rel|
+
+    def update(self, topk: np.ndarray, relevant: List[Set[int]]) -> None:
+        """`topk` [B, Kmax] ranked item ids; `relevant` one set per row."""
+        B = len(relevant)
+        if B == 0:
+            return
+        n_rel = np.array([len(r) for r in relevant])
+        R = max(int(n_rel.max()), 1)
+        rel = np.full((B, R), -1, dtype=np.int64)
+        for i, r in enumerate(relevant):
+            rel[i, :len(r)] = list(r)
+        filled = topk >= 0                      # -1 pads short rankings
+        is_rel = (topk[:, :, None] == rel[:, None, :]).any(-1) & filled   # [B, Kmax]
+
+        for k in self.ks:
+            hit_k = is_rel[:, :k]
+            n_hit = hit_k.sum(1)
+            dcg   = (hit_k * self._disc[:k]).sum(1)
+            idcg  = self._idcg[np.clip(np.minimum(n_rel, k), 1, None) - 1]
+            self.recall[k] += float((n_hit / np.maximum(n_rel, 1)).sum())
+            self.ndcg[k]   += float((dcg / idcg).sum())
+            self.hits[k]   += float((n_hit > 0).sum())
+            top = topk[:, :k][filled[:, :k]]
+            self.covered[k][top] = True
+        self.users += B
+
+    def result(self) -> Dict[str, float]:
+        n = max(self.users, 1)
+        out: Dict[str, float] = {"users": self.users}
+        for k in self.ks:
+            out[f"recall@{k}"]   = self.recall[k] / n
+            out[f"ndcg@{k}"]     = self.ndcg[k] / n
+            out[f"hit_rate@{k}"] = self.hits[k] / n
+            out[f"coverage@{k}"] = float(self.covered[k].mean())
+        return out
+
+
+# ────────────────────────────────────────────────────────────────────────────
+#  Batched scoring
+# ────────────────────────────────────────────────────────────────────────────
+
+@torch.no_grad()
+def _score_block(model, users: np.ndarray, hist: np.ndarray, cands: np.ndarray,
+                 cand_meta: torch.Tensor, device, max_rows: int) -> torch.Tensor:
+    """
+    Scores [B, C] for B users × C candidates (shared across the block).
+    History is encoded once per user; rows are processed `max_rows` at a time.
+    """
+    B, C = len(users), len(cands)
+    seq_emb, gru_out, _ = model.cf.encode_history(
+        torch.as_tensor(hist, dtype=torch.long, device=device))   # [B, T, D]
+    cand_t = torch.as_tensor(cands, dtype=torch.long, device=device)
+    user_t = torch.as_tensor(users, dtype=torch.long, device=device)
+
+    scores = torch.empty(B * C, device=device)
+    for s in range(0, B * C, max_rows):
+        r = torch.arange(s, min(s + max_rows, B * C), device=device)
+        ub, cb = r // C, r % C
+        preds, _ = model({
+            "u_idx":   user_t[ub],
+            "i_idx":   cand_t[cb],
+            "seq_emb": seq_emb[ub],
+            "gru_out": gru_out[ub],
+            "meta":    cand_meta[cb],
+        })
+        scores[s:s + len(r)] = preds
+    return scores.view(B, C)
+
+
+def evaluate_ranking(model,
+                     histories:   Dict[int, np.ndarray],
+                     test:        Dict[int, Set[int]],
+                     store,
+                     ks:          Sequence[int] = (5, 10, 20),
+                     n_negatives: Optional[int] = None,
+                     exclude_seen: bool = True,
+                     batch_users: int = 256,
+                     max_rows:    int = 16384,
+                     seed:        int = 42,
+                     log_every:   int = 50) -> Dict[str, float]:
+    """
+    Rank candidates for every user in `test` and return averaged metrics.
+
+    The catalog is the items with training rows in `store` (build it with
+    `train_feature_store`); held-out items outside it can never be hit.
+    n_negatives=None scores the full catalog; otherwise each user block
+    shares one random sample of `n_negatives` catalog items plus the
+    block's held-out items (sampled evaluation).
+    Users without a training history are skipped (see the cold-start path)
+    and counted in `skipped_users`.
+    """
+    device  = next(model.parameters()).device
+    model.eval()
+    n_items = len(store.item_last_row)
+    kmax    = max(ks)
+    rng     = np.random.default_rng(seed)
+    metrics = RankingMetrics(ks, n_items)
+
+    users = np.array([u for u in test if u in histories], dtype=np.int64)
+    catalog = np.flatnonzero(store.item_last_row >= 0).astype(np.int64)
+    if n_negatives is None:
+        full_meta = torch.as_tensor(store.item_meta(catalog), device=device)
+
+    t0 = time.perf_counter()
+    for b, s in enumerate(range(0, len(users), batch_users)):
+        ub   = users[s:s + batch_users]
+        hist = np.stack([histories[u] for u in ub])
+        rel  = [test[u] for u in ub]
+
+        if n_negatives is None:
+            cands, meta = catalog, full_meta
+        else:
+            pos = np.fromiter(set().union(*rel), dtype=np.int64)
+            pos = pos[pos < n_items]
+            pos = pos[store.item_last_row[pos] >= 0]
+            neg = rng.choice(catalog, size=min(n_negatives, len(catalog)), replace=False)
+            cands = np.unique(np.concatenate([pos, neg]))
+            meta  = torch.as_tensor(store.item_meta(cands), device=device)
+
+        scores = _score_block(model, ub, hist, cands, meta, device, max_rows)
+
+        if exclude_seen:                 # never recommend the training history
+            pos_of = np.full(n_items + 1, -1, dtype=np.int64)
+            pos_of[cands] = np.arange(len(cands))
+            rows, cols = [], []
+            for i, h in enumerate(hist):
+                c = pos_of[np.clip(h, 0, n_items)]
+                c = c[c >= 0]
+                # keep held-out items scoreable even if they also appear in history
+                c = c[~np.isin(cands[c], list(rel[i]))]
+                rows.append(np.full(len(c), i)); cols.append(c)
+            if rows:
+                scores[torch.as_tensor(np.concatenate(rows), device=device),
+                       torch.as_tensor(np.concatenate(cols), device=device)] = float("-inf")
+
+        k = min(kmax, len(cands))
+        top = torch.topk(scores, k, dim=1).indices.cpu().numpy()
+        topk = cands[top]
+        if k < kmax:                     # tiny catalogs: pad with an impossible id
+            topk = np.pad(topk, ((0, 0), (0, kmax - k)), constant_values=-1)
+        metrics.update(topk, rel)
+
+        if log_every and (b + 1) % log_every == 0:
+            done = s + len(ub)
+            print(f"[eval] {done}/{len(users)} users  "
+                  f"{done / (time.perf_counter() - t0):,.0f} users/s")
+
+    res = metrics.result()
+    res["seconds"] = time.perf_counter() - t0
+    res["skipped_users"] = len(test) - len(users)
+    return res
@@ -0,0 +1,175 @@
+# backend/feature_store.py
+"""
+Item-level feature store that replaces the per-interaction meta matrix.
+
+`build_meta_matrix` copies every product feature (price, encodings, title
+and feature-text embeddings) into every interaction row.  `FeatureStore`
+keeps those once per `i_idx` and keeps only truly row-level features
+per interaction: sentiment and the review embedding, plus any block that
+actually varies between interactions of the same item (e.g. colour or
+material when they describe the purchased variant).  Batches are
+assembled by gather, producing the same column layout as
+`build_meta_matrix` (equal up to `VARY_ATOL`), so existing checkpoints
+keep working.
+"""
+
+from __future__ import annotations
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from backend.training import EMB_DIM
+
+# meta blocks always kept per interaction; others are per item unless
+# `from_frame` finds them varying within an item
+ROW_LEVEL = {"sentiment", "review"}
+# per-item blocks may differ by this much between rows of one item: the same
+# text encoded in differently padded batches is not bit-identical
+VARY_ATOL = 1e-5
+EMB_ORDER = ("review", "features", "product_title")
+
+
+class FeatureStore:
+    """
+    item_feats  [n_items, d_item]  – one row per i_idx
+    row_feats   [n_rows,  d_row]   – one row per interaction (df position)
+    """
+    def __init__(self,
+                 item_feats: np.ndarray,
+                 row_feats:  np.ndarray,
+                 item_dst:   np.ndarray,
+                 row_dst:    np.ndarray,
+                 item_last_row: np.ndarray):
+        self.item_feats    = item_feats
+        self.row_feats     = row_feats
+        self.item_dst      = item_dst          # meta column of each item column
+        self.row_dst       = row_dst           # meta column of each row column
+        self.item_last_row = item_last_row     # latest interaction per item (-1: none)
+        self.meta_dim      = len(item_dst) + len(row_dst)
+
+    # --------------------------------------------------------------------- #
+    @classmethod
+    def from_frame(cls,
+                   df:  pd.DataFrame,
+                   emb: Dict[str, np.ndarray],
+                   struct_cols: List[str],
+                   row_level: Optional[Iterable[str]] = None,
+                   atol: float = VARY_ATOL) -> "FeatureStore":
+        """
+        Same inputs as `build_meta_matrix`; same output layout on gather.
+        `row_level` names the blocks stored per interaction; by default
+        `ROW_LEVEL` plus every block that differs by more than `atol`
+        between rows of the same item, so `gather` reproduces the dense
+        matrix to within `atol`.
+        """
+        n_rows  = len(df)
+        i_idx   = df["i_idx"].to_numpy()
+        n_items = int(i_idx.max()) + 1 if n_rows else 0
+
+        last_row = np.full(n_items, -1, dtype=np.int64)
+        last_row[i_idx] = np.arange(n_rows)          # repeated index → last wins
+        has_row = last_row >= 0
+
+        def _is_row_level(name: str, src: np.ndarray) -> bool:
+            if row_level is not None:
+                return name in row_level
+            if name in ROW_LEVEL:
+                return True
+            varies = not np.allclose(src, src[last_row[i_idx]], rtol=0, atol=atol,
+                                     equal_nan=True)
+            if varies:
+                print(f"[features] '{name}' varies within items → kept per row")
+            return varies
+
+        # (name, [n_rows, w] source, row-level?)
+        blocks: List[Tuple[str, np.ndarray, bool]] = []
+        for col in struct_cols:
+            if col in df.columns:
+                src = df[[col]].to_numpy(dtype="float32")
+            else:
+                print(f"⚠️ '{col}' missing → zeros")
+                src = np.zeros((n_rows, 1), dtype="float32")
+            blocks.append((col, src, _is_row_level(col, src)))
+        for name in EMB_ORDER:
+            if name in emb:
+                src = emb[name]
+            else:
+                print(f"⚠️ '{name}' embedding missing → zeros")
+                src = np.zeros((n_rows, EMB_DIM), dtype="float32")
+            blocks.append((name, src, _is_row_level(name, src)))
+
+        item_parts, row_parts, item_dst, row_dst, pos = [], [], [], [], 0
+        for name, src, row_level in blocks:
+            w = src.shape[1]
+            cols = np.arange(pos, pos + w); pos += w
+            if row_level:
+                row_parts.append(src); row_dst.append(cols)
+            else:
+                per_item = np.zeros((n_items, w), dtype=src.dtype)
+                per_item[has_row] = src[last_row[has_row]]
+                item_parts.append(per_item); item_dst.append(cols)
+
+        def _cat(parts, n):
+            if not parts:
+                return np.zeros((n, 0), dtype="float32")
+            dt = np.result_type(*[p.dtype for p in parts])
+            return np.ascontiguousarray(np.hstack(parts).astype(dt, copy=False))
+
+        cat_idx = lambda l: np.concatenate(l) if l else np.empty(0, dtype=np.int64)
+        return cls(_cat(item_parts, n_items), _cat(row_parts, n_rows),
+                   cat_idx(item_dst), cat_idx(row_dst), last_row)
+
+    def arrays(self) -> Dict[str, np.ndarray]:
+        """Backing arrays (e.g. for `np.savez`); `FeatureStore(**arrays)` rebuilds it."""
+        return {"item_feats": self.item_feats, "row_feats": self.row_feats,
+                "item_dst": self.item_dst, "row_dst": self.row_dst,
+                "item_last_row": self.item_last_row}
+
+    # --------------------------------------------------------------------- #
+    @property
+    def shape(self) -> Tuple[int, int]:
+        """(n_rows, meta_dim) – mirrors the dense matrix it replaces."""
+        return (len(self.row_feats), self.meta_dim)
+
+    def gather(self, rows, items) -> np.ndarray:
+        """Meta rows for interactions `rows` of items `items` → [B, meta_dim] f32."""
+        rows  = np.atleast_1d(np.asarray(rows,  dtype=np.int64))
+        items = np.atleast_1d(np.asarray(items, dtype=np.int64))
+        out = np.zeros((len(items), self.meta_dim), dtype=np.float32)
+
+        known = (items >= 0) & (items < len(self.item_feats))
+        out[np.ix_(known, self.item_dst)] = self.item_feats[items[known]]
+        valid = rows >= 0
+        out[np.ix_(valid, self.row_dst)] = self.row_feats[rows[valid]]
+        return out
+
+    def item_meta(self, items) -> np.ndarray:
+        """
+        Meta for scoring `items` outside any specific interaction; row-level
+        parts come from each item's latest interaction (zeros if none).
+        """
+        items = np.atleast_1d(np.asarray(items, dtype=np.int64))
+        known = (items >= 0) & (items < len(self.item_last_row))
+        rows = np.full(len(items), -1, dtype=np.int64)
+        rows[known] = self.item_last_row[items[known]]
+        return self.gather(rows, items)
+
+    # --------------------------------------------------------------------- #
+    @property
+    def nbytes(self) -> int:
+        return (self.item_feats.nbytes + self.row_feats.nbytes
+                + self.item_last_row.nbytes)
+
+    def footprint(self) -> Dict[str, float]:
+        """Bytes held vs. the float32 per-row matrix `build_meta_matrix` makes."""
+        dense = len(self.row_feats) * self.meta_dim * 4
+        return {"dense_bytes": dense, "store_bytes": self.nbytes,
+                "saving": 1.0 - self.nbytes / dense if dense else 0.0}
+
+    def log_footprint(self, tag: str = "features") -> Dict[str, float]:
+        fp = self.footprint()
+        print(f"[{tag}] meta store {fp['store_bytes']/2**20:,.1f} MiB "
+              f"(vs. {fp['dense_bytes']/2**20:,.1f} MiB as a dense meta matrix, "
+              f"{100*fp['saving']:.0f}% smaller)")
+        return fp
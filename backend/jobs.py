@@ -0,0 +1,107 @@
+# backend/jobs.py
+"""
+Tracked background jobs for long-running API work.
+
+Blocking work (CSV parsing, VADER, fuzzy matching, text encoding) runs on
+a dedicated thread pool so the event loop – and `/healthz` – keep
+answering.  Each job exposes its current stage and percent complete.
+"""
+
+from __future__ import annotations
+import os, threading, time, traceback, uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+
+class Job:
+    def __init__(self, kind: str, workspace_id: Optional[str] = None):
+        self.id           = uuid.uuid4().hex
+        self.kind         = kind
+        self.workspace_id = workspace_id
+        self.status       = "queued"       # queued | running | done | failed
+        self.stage        = "queued"
+        self.percent      = 0.0
+        self.result: Any  = None
+        self.error: Optional[str] = None
+        self.created      = time.time()
+        self.started: Optional[float]  = None
+        self.finished: Optional[float] = None
+
+    def progress(self, stage: str, percent: float) -> None:
+        """Callback handed to the worker: record stage and % (monotonic)."""
+        self.stage   = stage
+        self.percent = max(self.percent, min(100.0, float(percent)))
+
+    def to_dict(self) -> Dict[str, Any]:
+        end = self.finished or time.time()
+        return {
+            "job_id":       self.id,
+            "kind":         self.kind,
+            "workspace_id": self.workspace_id,
+            "status":       self.status,
+            "stage":        self.stage,
+            "percent":      round(self.percent, 1),
+            "elapsed_s":    round(end - self.started, 2) if self.started else 0.0,
+            "error":        self.error,
+            "result":       self.result if self.status == "done" else None,
+        }
+
+
+class JobRegistry:
+    """
+    Thread pool + job table. `submit` returns immediately.
+
+    Kinds listed in `kind_workers` get a pool of their own, so hours-long
+    jobs (training) never hold the shared workers that short ones
+    (preprocessing) queue on.
+    """
+
+    def __init__(self, max_workers: Optional[int] = None,
+                 keep_finished: int = 1000,
+                 kind_workers: Optional[Dict[str, int]] = None):
+        if max_workers is None:
+            max_workers = int(os.getenv("RECOAI_JOB_WORKERS", 2))
+        self.executor = ThreadPoolExecutor(max_workers=max_workers,
+                                           thread_name_prefix="recoai-job")
+        self.executors = {kind: ThreadPoolExecutor(max_workers=n,
+                                                   thread_name_prefix=f"recoai-{kind}")
+                          for kind, n in (kind_workers or {}).items()}
+        self.keep_finished = keep_finished
+        self._jobs: Dict[str, Job] = {}
+        self._lock = threading.Lock()
+
+    def submit(self, kind: str, fn: Callable[[Job], Any],
+               workspace_id: Optional[str] = None) -> Job:
+        job = Job(kind, workspace_id)
+        with self._lock:
+            self._jobs[job.id] = job
+            self._prune()
+        self.executors.get(kind, self.executor).submit(self._run, job, fn)
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def shutdown(self) -> None:
+        for ex in (self.executor, *self.executors.values()):
+            ex.shutdown(wait=False, cancel_futures=True)
+
+    # --------------------------------------------------------------------- #
+    def _run(self, job: Job, fn: Callable[[Job], Any]) -> None:
+        job.status, job.started = "running", time.time()
+        try:
+            job.result = fn(job)
+            job.progress("done", 100.0)
+            job.status = "done"
+        except Exception as e:
+            job.status, job.error = "failed", f"{type(e).__name__}: {e}"
+            traceback.print_exc()
+        finally:
+            job.finished = time.time()
+
+    def _prune(self) -> None:
+        done = [j for j in self._jobs.values() if j.finished is not None]
+        excess = len(done) - self.keep_finished
+        for j in sorted(done, key=lambda j: j.finished)[:max(excess, 0)]:
+            self._jobs.pop(j.id, None)
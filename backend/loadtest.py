@@ -0,0 +1,452 @@
+# backend/loadtest.py
+"""
+End-to-end load generator for `backend.main:app`.
+
+    python -m backend.loadtest --mode inprocess --rows 5000 \\
+        --scenarios serving mixed --concurrency 1 8 32 --duration 30 \\
+        --out loadtest.json
+
+Seeds a workspace with a synthetic dataset (upload → preprocess), then for
+every (scenario, concurrency) pair runs closed-loop clients that each pick
+an operation from the scenario's weighted mix until `--duration` elapses.
+Reports p50/p95/p99 latency, req/s, error rate and peak server RSS per run
+as JSON.  No external services: `inprocess` drives the ASGI app directly,
+`uvicorn` starts a local server subprocess.
+
+Operations
+• upload      – POST /upload of a fresh synthetic CSV into a scratch workspace
+• preprocess  – POST /preprocess + polling until the job finishes (end-to-end)
+• fine_tune   – POST /fine_tune on the seeded workspace (submit latency;
+                training runs on the server's job pool and loads it). At
+                most `--max-training` run at once; while saturated the op
+                polls GET /fine_tune/{job_id} instead ("fine_tune_status").
+                Outstanding trainings are drained after every run so they
+                do not bleed into the next measurement.
+• recommend   – GET /recommend for a known user (or a new one, `--cold-frac`)
+• interaction – POST /interactions for a known user
+"""
+
+from __future__ import annotations
+import argparse, asyncio, io, json, os, platform, random, resource, socket
+import subprocess, sys, threading, time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+import httpx
+import numpy as np
+import pandas as pd
+
+
+SCENARIOS: Dict[str, Dict[str, float]] = {
+    "serving":   {"recommend": 0.9, "interaction": 0.1},
+    "recommend": {"recommend": 1.0},
+    "ingest":    {"upload": 0.7, "preprocess": 0.3},
+    "mixed":     {"recommend": 0.85, "interaction": 0.08, "upload": 0.04,
+                  "preprocess": 0.02, "fine_tune": 0.01},
+}
+
+
+# ────────────────────────────────────────────────────────────────────────────
+#  Synthetic data
+# ────────────────────────────────────────────────────────────────────────────
+
+def synthetic_dataset(n_rows: int = 5000, n_users: int = 500, n_items: int = 300,
+                      seed: int = 0) -> pd.DataFrame:
+    """Raw interaction CSV in the shape `/upload` + `Preprocessing` expect."""
+    rng = np.random.default_rng(seed)
+    items = np.minimum(rng.zipf(1.3, n_rows) - 1, n_items - 1)     # popularity skew
+    cats  = ["shoes", "bags", "tops", "dresses", "accessories"]
+    words = np.array(["great", "poor", "comfy", "cheap", "lovely", "broke",
+                      "fits", "small", "soft", "perfect", "returned", "nice"])
+    item_cat   = rng.integers(0, len(cats), n_items)
+    item_price = rng.gamma(2.0, 20.0, n_items).round(2)
+    rating = rng.integers(1, 6, n_rows)
+    return pd.DataFrame({
+        "user_id":       [f"U{u:06d}" for u in rng.integers(0, n_users, n_rows)],
+        "product_id":    [f"P{i:06d}" for i in items],
+        "click":         (rng.random(n_rows) < 0.2 + 0.12 * rating).astype(int),
+        "rating":        rating,
+        "review_text":   [" ".join(rng.choice(words, 6)) for _ in range(n_rows)],
+        "category":      [cats[item_cat[i]] for i in items],
+        "product_title": [f"{cats[item_cat[i]]} item {i}" for i in items],
+        "price":         item_price[items],
+        "color":         rng.choice(["red", "blue", "black", "white"], n_rows),
+        "material":      rng.choice(["cotton", "leather", "wool", "nylon"], n_rows),
+        "features":      [f"{cats[item_cat[i]]} {i % 7} {i % 11}" for i in items],
+    })
+
+
+def _csv_bytes(df: pd.DataFrame) -> bytes:
+    buf = io.StringIO(); df.to_csv(buf, index=False)
+    return buf.getvalue().encode()
+
+
+# ────────────────────────────────────────────────────────────────────────────
+#  Measurement
+# ────────────────────────────────────────────────────────────────────────────
+
+def _rss_bytes(pid: int) -> Optional[int]:
+    """Current RSS of `pid` from /proc (None where /proc is unavailable)."""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        return None
+    return None
+
+
+class RssSampler:
+    """Background thread recording the peak RSS of one process."""
+
+    def __init__(self, pid: int, interval: float = 0.1):
+        self.pid, self.interval = pid, interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+
+    def _loop(self):
+        while not self._stop.is_set():
+            rss = _rss_bytes(self.pid)
+            if rss is not None:
+                self.peak = max(self.peak, rss)
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self._thread.start(); return self
+
+    def __exit__(self, *exc):
+        self._stop.set(); self._thread.join()
+        if not self.peak and self.pid == os.getpid():      # no /proc: lifetime peak
+            kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            self.peak = kb if sys.platform == "darwin" else kb * 1024
+
+
+def _latency_stats(lat: List[float]) -> Dict[str, float]:
+    if not lat:
+        return {"p50": None, "p95": None, "p99": None, "mean": None, "max": None}
+    a = np.asarray(lat) * 1000.0
+    p50, p95, p99 = np.percentile(a, [50, 95, 99])
+    return {"p50": round(p50, 2), "p95": round(p95, 2), "p99": round(p99, 2),
+            "mean": round(float(a.mean()), 2), "max": round(float(a.max()), 2)}
+
+
+class Recorder:
+    def __init__(self):
+        self.samples: Dict[str, List[float]] = {}
+        self.errors:  Dict[str, int] = {}
+        self.status:  Dict[str, int] = {}
+
+    def add(self, op: str, seconds: float, status: str, ok: bool) -> None:
+        self.samples.setdefault(op, []).append(seconds)
+        self.status[status] = self.status.get(status, 0) + 1
+        if not ok:
+            self.errors[op] = self.errors.get(op, 0) + 1
+
+    def report(self, elapsed: float) -> dict:
+        every = [s for v in self.samples.values() for s in v]
+        n, n_err = len(every), sum(self.errors.values())
+        per_op = {op: {"requests": len(v), "errors": self.errors.get(op, 0),
+                       "rps": round(len(v) / elapsed, 2),
+                       "latency_ms": _latency_stats(v)}
+                  for op, v in sorted(self.samples.items())}
+        return {"requests": n, "errors": n_err,
+                "error_rate": round(n_err / n, 4) if n else 0.0,
+                "rps": round(n / elapsed, 2),
+                "latency_ms": _latency_stats(every),
+                "status_codes": dict(sorted(self.status.items())),
+                "operations": per_op}
+
+
+# ────────────────────────────────────────────────────────────────────────────
+#  Operations
+# ────────────────────────────────────────────────────────────────────────────
+
+class Target:
+    """Shared state for the operations: workspaces and id ranges."""
+
+    def __init__(self, client: httpx.AsyncClient, args):
+        self.client   = client
+        self.args     = args
+        self.ws       = None     # seeded workspace: serving traffic
+        self.scratch  = None     # workspace that upload / preprocess churn
+        self.n_users  = 0
+        self.n_items  = 0
+        self.job_id: Optional[str] = None    # fine-tune job to recommend from
+        self.upload_n = 0
+        self.training: List[str] = []        # fine-tune jobs started by the run
+        self._submitting = 0
+
+    async def upload(self, workspace_id: Optional[str] = None) -> httpx.Response:
+        self.upload_n += 1
+        df = synthetic_dataset(self.args.upload_rows, self.args.users, self.args.items,
+                               seed=self.args.seed + self.upload_n)
+        params = {"workspace_id": workspace_id} if workspace_id else {}
+        return await self.client.post(
+            "/upload", params=params,
+            files={"data_file": ("synthetic.csv", _csv_bytes(df), "text/csv")})
+
+    async def wait_job(self, kind: str, job_id: str) -> httpx.Response:
+        """Poll GET /{kind}/{job_id} until the job is done or failed."""
+        deadline = time.monotonic() + self.args.job_timeout
+        while time.monotonic() < deadline:
+            await asyncio.sleep(self.args.poll_interval)
+            s = await self.client.get(f"/{kind}/{job_id}")
+            if s.status_code != 200 or s.json()["status"] in ("done", "failed"):
+                return s
+        raise TimeoutError(f"{kind} job {job_id} exceeded {self.args.job_timeout}s")
+
+    async def preprocess(self, workspace_id: str) -> httpx.Response:
+        r = await self.client.post("/preprocess", params={"workspace_id": workspace_id})
+        if r.status_code != 202:
+            return r
+        return await self.wait_job("preprocess", r.json()["job_id"])
+
+    async def fine_tune(self):
+        """
+        Submit a fine-tune, or poll the oldest one while at the cap.
+        Returns None (nothing to record) while another client's submit is
+        still in flight.
+        """
+        if len(self.training) + self._submitting >= self.args.max_training:
+            job_id = self.training[0] if self.training else None
+            if job_id is None:                   # a submit is in flight
+                await asyncio.sleep(self.args.poll_interval)
+                return None
+            s = await self.client.get(f"/fine_tune/{job_id}")
+            if (s.status_code != 200 or s.json()["status"] in ("done", "failed")) \
+                    and job_id in self.training:
+                self.training.remove(job_id)
+            return "fine_tune_status", s
+        self._submitting += 1
+        try:
+            r = await self.client.post("/fine_tune", params={"workspace_id": self.ws})
+        finally:
+            self._submitting -= 1
+        if r.status_code == 200:
+            self.training.append(r.json()["job_id"])
+        return r
+
+    async def drain_training(self) -> float:
+        """Wait for every fine-tune this run started; returns seconds waited."""
+        t0 = time.perf_counter()
+        while self.training:
+            await self.wait_job("fine_tune", self.training.pop(0))
+        return time.perf_counter() - t0
+
+
+def _job_ok(r: httpx.Response) -> bool:
+    if r.status_code >= 400:
+        return False
+    path = r.request.url.path
+    if path.startswith("/preprocess/"):
+        return r.json().get("status") == "done"
+    if path.startswith("/fine_tune/"):
+        return r.json().get("status") != "failed"
+    return True
+
+
+def _operations(t: Target, rng: random.Random) -> Dict[str, Callable]:
+    def user():
+        if rng.random() < t.args.cold_frac:
+            return t.n_users + rng.randrange(1_000_000)     # no history → cold start
+        return rng.randrange(t.n_users)
+
+    def recommend():
+        params = {"workspace_id": t.ws, "user_id": user(), "k": t.args.k}
+        if t.job_id: params["job_id"] = t.job_id
+        return t.client.get("/recommend", params=params)
+
+    def interaction():
+        params = {"workspace_id": t.ws, "user_id": rng.randrange(t.n_users),
+                  "item_id": rng.randrange(t.n_items)}
+        if t.job_id: params["job_id"] = t.job_id
+        return t.client.post("/interactions", params=params)
+
+    return {
+        "upload":      lambda: t.upload(t.scratch),
+        "preprocess":  lambda: t.preprocess(t.scratch),
+        "fine_tune":   t.fine_tune,
+        "recommend":   recommend,
+        "interaction": interaction,
+    }
+
+
+# ────────────────────────────────────────────────────────────────────────────
+#  Runner
+# ────────────────────────────────────────────────────────────────────────────
+
+async def _seed(t: Target) -> dict:
+    """Seeded + scratch workspaces, both preprocessed before any timing."""
+    t0 = time.perf_counter()
+    df = synthetic_dataset(t.args.rows, t.args.users, t.args.items, t.args.seed)
+    r = await t.client.post("/upload", files={
+        "data_file": ("synthetic.csv", _csv_bytes(df), "text/csv")})
+    r.raise_for_status()
+    t.ws = r.json()["workspace_id"]
+    r = await t.upload(); r.raise_for_status()
+    t.scratch = r.json()["workspace_id"]
+
+    for ws in (t.ws, t.scratch):
+        r = await t.preprocess(ws)
+        if not _job_ok(r):
+            raise RuntimeError(f"seeding preprocess failed: {r.text}")
+    t.n_users = int(df["user_id"].nunique())
+    t.n_items = int(df["product_id"].nunique())
+
+    if t.args.fine_tuned:                # serve from a fine-tuned head
+        r = await t.client.post("/fine_tune", params={"workspace_id": t.ws})
+        r.raise_for_status()
+        job_id = r.json()["job_id"]
+        s = await t.wait_job("fine_tune", job_id)
+        if not _job_ok(s) or s.json()["status"] != "done":
+            raise RuntimeError(f"seeding fine-tune failed: {s.text}")
+        t.job_id = job_id
+
+    return {"workspace_id": t.ws, "rows": len(df), "users": t.n_users,
+            "items": t.n_items, "fine_tune_job": t.job_id,
+            "seconds": round(time.perf_counter() - t0, 2)}
+
+
+async def run_scenario(t: Target, name: str, mix: Dict[str, float],
+                       concurrency: int, duration: float, pid: int) -> dict:
+    rec = Recorder()
+    deadline = time.monotonic() + duration
+
+    async def client(i: int):
+        rng = random.Random(t.args.seed * 1000 + i)
+        ops = _operations(t, rng)
+        names, weights = list(mix), list(mix.values())
+        while time.monotonic() < deadline:
+            op = rng.choices(names, weights)[0]
+            t0 = time.perf_counter()
+            label = op
+            try:
+                r = await ops[op]()
+                if r is None:
+                    continue
+                if isinstance(r, tuple):         # op substituted another call
+                    label, r = r
+                rec.add(label, time.perf_counter() - t0, str(r.status_code), _job_ok(r))
+            except Exception as e:
+                rec.add(label, time.perf_counter() - t0, type(e).__name__, False)
+
+    print(f"[loadtest] {name} × {concurrency} for {duration:.0f}s")
+    with RssSampler(pid) as rss:
+        t0 = time.perf_counter()
+        await asyncio.gather(*(client(i) for i in range(concurrency)))
+        elapsed = time.perf_counter() - t0
+    drained = await t.drain_training()          # untimed: keep runs independent
+
+    out = {"scenario": name, "mix": mix, "concurrency": concurrency,
+           "duration_s": round(elapsed, 2), **rec.report(elapsed),
+           "peak_rss_mb": round(rss.peak / 2**20, 1) if rss.peak else None,
+           "training_drain_s": round(drained, 2)}
+    lat = out["latency_ms"]
+    print(f"[loadtest]   {out['rps']} req/s  p50={lat['p50']}ms  p95={lat['p95']}ms  "
+          f"p99={lat['p99']}ms  errors={out['error_rate']:.2%}  "
+          f"rss={out['peak_rss_mb']}MiB")
+    return out
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+async def _wait_healthy(client: httpx.AsyncClient, proc, timeout: float) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"uvicorn exited with code {proc.returncode}")
+        try:
+            if (await client.get("/healthz")).status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        await asyncio.sleep(0.5)
+    raise TimeoutError(f"server not healthy after {timeout}s")
+
+
+async def run(args) -> dict:
+    timeout = httpx.Timeout(args.request_timeout)
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        raise SystemExit(f"unknown scenarios {sorted(unknown)}; choose from {sorted(SCENARIOS)}")
+
+    async def _drive(client, pid):
+        t = Target(client, args)
+        seed = await _seed(t)
+        print(f"[loadtest] seeded {seed}")
+        runs = [await run_scenario(t, name, SCENARIOS[name], c, args.duration, pid)
+                for name in args.scenarios for c in args.concurrency]
+        return seed, runs
+
+    if args.mode == "inprocess":
+        from backend.main import app
+        transport = httpx.ASGITransport(app=app)
+        async with app.router.lifespan_context(app):
+            async with httpx.AsyncClient(transport=transport, base_url="http://loadtest",
+                                         timeout=timeout) as client:
+                seed, runs = await _drive(client, os.getpid())
+    else:
+        port = args.port or _free_port()
+        proc = subprocess.Popen([sys.executable, "-m", "uvicorn", "backend.main:app",
+                                 "--host", "127.0.0.1", "--port", str(port),
+                                 "--workers", "1", "--log-level", "warning"])
+        try:
+            limits = httpx.Limits(max_connections=max(args.concurrency) * 2)
+            async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}",
+                                         timeout=timeout, limits=limits) as client:
+                await _wait_healthy(client, proc, args.startup_timeout)
+                seed, runs = await _drive(client, proc.pid)
+        finally:
+            proc.terminate()
+            try: proc.wait(timeout=30)
+            except subprocess.TimeoutExpired: proc.kill()
+
+    return {
+        "meta": {"mode": args.mode, "started": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                 "python": platform.python_version(), "cpus": os.cpu_count(),
+                 "platform": platform.platform(),
+                 "args": {k: v for k, v in vars(args).items() if k != "out"}},
+        "seed": seed,
+        "runs": runs,
+    }
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    ap.add_argument("--mode", choices=["inprocess", "uvicorn"], default="inprocess")
+    ap.add_argument("--port", type=int)
+    ap.add_argument("--scenarios", nargs="+", default=["serving", "mixed"])
+    ap.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    ap.add_argument("--duration", type=float, default=30.0, help="seconds per run")
+    ap.add_argument("--rows", type=int, default=5000, help="seeded dataset rows")
+    ap.add_argument("--upload-rows", type=int, default=1000, help="rows per /upload op")
+    ap.add_argument("--users", type=int, default=500)
+    ap.add_argument("--items", type=int, default=300)
+    ap.add_argument("--k", type=int, default=5)
+    ap.add_argument("--cold-frac", type=float, default=0.1,
+                    help="share of /recommend calls for users without history")
+    ap.add_argument("--fine-tuned", action="store_true",
+                    help="fine-tune the seeded workspace and serve from that head")
+    ap.add_argument("--max-training", type=int, default=1,
+                    help="fine-tune jobs allowed to run at once during a scenario")
+    ap.add_argument("--poll-interval", type=float, default=0.5)
+    ap.add_argument("--job-timeout", type=float, default=1800.0)
+    ap.add_argument("--request-timeout", type=float, default=120.0)
+    ap.add_argument("--startup-timeout", type=float, default=600.0)
+    ap.add_argument("--seed", type=int, default=42)
+    ap.add_argument("--out", type=Path)
+    args = ap.parse_args()
+
+    report = asyncio.run(run(args))
+    text = json.dumps(report, indent=2, default=str)
+    if args.out:
+        args.out.write_text(text)
+        print(f"[loadtest] report → {args.out}")
+    else:
+        print(text)
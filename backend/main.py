@@ -4,84 +4,84 @@
 # ───────────────────────────────────────────────────────────────
 from __future__ import annotations
 
-import os, uuid, tempfile, copy
+import os, tempfile, copy, asyncio
 from pathlib import Path
-from typing import List, Dict, Optional
+from typing import Dict, Optional
 
 import numpy as np
 import pandas as pd
 import torch
-from torch.utils.data import Dataset, DataLoader, WeightedRandomSampler
 from sklearn.model_selection import train_test_split
-from sklearn.metrics import roc_auc_score
 
-from fastapi import FastAPI, UploadFile, File, HTTPException, BackgroundTasks
+from fastapi import FastAPI, UploadFile, File, HTTPException
+from fastapi.concurrency import run_in_threadpool
 from fastapi.responses import FileResponse
 from fastapi.middleware.cors import CORSMiddleware
 
 from backend.preprocessing import Preprocessing
 from backend.model import HybridDeepFM
-from backend.core_models import BASE_MODEL, CKPT          # CKPT: pre-trained state_dict
+from backend.core_models import BASE_MODEL, CKPT, EMBED_PIPELINE   # CKPT: pre-trained state_dict
+from backend.workspace import WorkspaceStore
+from backend.jobs import JobRegistry
+from backend.training import RecommenderDataset, run_fine_tune, META_COLS, EMB_DIM
+from backend.feature_store import FeatureStore
+from backend.distributed import fine_tune_distributed
+from backend.retrieval import CandidateRetriever
+from backend.top_k import hybrid_topk_recommendation, build_item_maps
+from backend.user_state import UserStateCache, MemoryBudget
+from backend.cold_start import ColdStartTable
 
 # ─────────────────────────── Hyper-params ───────────────────────────
 MAX_SEQ_LEN   = 50
-EMB_DIM       = 64
 HIDDEN_DIM    = 96
 AUX_WEIGHT    = 0.65
 BATCH_SIZE    = 512
 LR_DEFAULT    = 3e-5
 EPOCHS_DEFAULT= 30
 
-META_COLS = ["price_scaled", "sentiment",
-             "category_encoded", "color_encoded", "material_encoded"]
+WS_IDLE_SECONDS    = float(os.getenv("RECOAI_WS_IDLE_SECONDS", 600))
+WS_SPILL_INTERVAL  = 60          # seconds between idle sweeps
+WS_ROOT            = os.getenv("RECOAI_WS_ROOT")   # None → temp dir
+# one byte budget for every (workspace, job) user-state cache in the process
+USER_STATE_BUDGET  = MemoryBudget(int(os.getenv("RECOAI_USER_STATE_MB", 512)) << 20)
+TRAIN_JOB_WORKERS  = int(os.getenv("RECOAI_TRAIN_WORKERS", 1))   # concurrent fine-tunes
 
-# ─────────────────────────── Helpers ────────────────────────────────
-EMB_DIM = 64      # keep in sync with your text encoder
+# candidate budgets of the retrieval stage (see `python -m backend.retrieval`)
+RETRIEVE_BUDGETS = dict(
+    n_embedding = int(os.getenv("RECOAI_RETRIEVE_EMBEDDING", 200)),
+    n_neighbour = int(os.getenv("RECOAI_RETRIEVE_NEIGHBOUR", 100)),
+    n_popular   = int(os.getenv("RECOAI_RETRIEVE_POPULAR", 50)),
+)
 
-def build_meta_matrix(df: pd.DataFrame,
-                      emb: Dict[str, np.ndarray],
-                      struct_cols: List[str]) -> np.ndarray:
+# ─────────────────────────── Helpers ────────────────────────────────
+def build_item_embeddings(df: pd.DataFrame,
+                          emb: Dict[str, np.ndarray]) -> np.ndarray:
+    """
+    One title-embedding row per i_idx (+ zero PAD row) for the past-item
+    KNN in `hybrid_topk_recommendation`.
     """
-    Stack [structured | review_emb | feature_emb | title_emb]
-    • Missing structured cols → zeros
-    • Missing embedding keys → zeros
+    src = emb.get("product_title", emb.get("features"))
+    n_rows = int(df["i_idx"].max()) + 2                 # items + PAD
+    if src is None:
+        return np.zeros((n_rows, EMB_DIM), dtype="float32")
+    out = np.zeros((n_rows, src.shape[1]), dtype="float32")
+    out[df["i_idx"].values] = src                       # last row per item wins
+    return out
+
+def tenant_model() -> HybridDeepFM:
     """
-    parts: List[np.ndarray] = []
-
-    # structured features
-    for col in struct_cols:
-        if col in df.columns:
-            parts.append(df[[col]].values.astype("float32"))
-        else:
-            print(f"⚠️ '{col}' missing → zeros")
-            parts.append(np.zeros((len(df), 1), dtype="float32"))
-
-    # text / dense embeddings
-    for name in ("review", "features", "product_title"):
-        if name in emb:
-            parts.append(emb[name].astype("float32"))
-        else:
-            print(f"⚠️ '{name}' embedding missing → zeros")
-            parts.append(np.zeros((len(df), EMB_DIM), dtype="float32"))
-
-    return np.hstack(parts)
-
-class RecommenderDataset(Dataset):
-    def __init__(self, df, meta, labels):
-        self.u_idx = torch.tensor(df["u_idx"].values, dtype=torch.long)
-        self.i_idx = torch.tensor(df["i_idx"].values, dtype=torch.long)
-        self.seq   = torch.tensor(np.vstack(df["seq"].values), dtype=torch.long)
-        self.meta  = torch.tensor(meta, dtype=torch.float32)
-        self.y     = torch.tensor(labels, dtype=torch.float32)
-
-    def __len__(self): return len(self.y)
-    def __getitem__(self, i):
-        return {"u_idx": self.u_idx[i], "i_idx": self.i_idx[i],
-                "seq": self.seq[i],     "meta":  self.meta[i]}, self.y[i]
+    Copy of BASE_MODEL for one tenant. The frozen CF tower (the large
+    embedding tables) is shared with BASE_MODEL instead of duplicated.
+    """
+    return copy.deepcopy(BASE_MODEL, {id(BASE_MODEL.cf): BASE_MODEL.cf})
 
 def safe_load_pretrained(model: HybridDeepFM,
                          state: dict,
                          skip_embeddings: bool = True):
+    """
+    Load the matching entries of `state` only. Everything else – notably
+    the CF tower shared with BASE_MODEL – is left untouched, not rewritten.
+    """
     ms = model.state_dict(); ok, skip = {}, []
     for k, v in state.items():
         if k not in ms:                               skip.append(k); continue
@@ -90,41 +90,81 @@ def safe_load_pretrained(model: HybridDeepFM,
                                                      skip.append(k); continue
         if ms[k].shape != v.shape:                   skip.append(k); continue
         ok[k] = v
-    model.load_state_dict({**ms, **ok})
+    model.load_state_dict(ok, strict=False)
     print(f"✓ loaded {len(ok)} layers – skipped {len(skip)}")
 
 # ─────────────────────────── FastAPI app ────────────────────────────
 app = FastAPI(title="RecoAI Preprocess + Fine-Tune API", version="0.2.0")
 app.add_middleware(CORSMiddleware, allow_origins=["*"],
-                   allow_methods=["GET","POST"], allow_headers=["*"])
+                   allow_methods=["GET","POST","DELETE"], allow_headers=["*"])
 
 @app.on_event("startup")
 async def _init():
-    app.state.raw_df          = None   # raw upload
-    app.state.df_processed    = None   # cleaned DF
-    app.state.embeddings      = None   # dict of np arrays
-    app.state.ft_models       = {}
+    app.state.workspaces = WorkspaceStore(tenant_model, root=WS_ROOT,
+                                          idle_seconds=WS_IDLE_SECONDS)
+
+    async def _spill_loop():
+        while True:
+            await asyncio.sleep(WS_SPILL_INTERVAL)
+            await run_in_threadpool(app.state.workspaces.spill_idle)
+    app.state.spill_task = asyncio.create_task(_spill_loop())
+    # fine-tunes get their own pool: they must not starve /preprocess
+    app.state.jobs       = JobRegistry(kind_workers={"fine_tune": TRAIN_JOB_WORKERS})
+
+@app.on_event("shutdown")
+async def _shutdown():
+    app.state.spill_task.cancel()
+    app.state.jobs.shutdown()
+    EMBED_PIPELINE.close()
+
+async def _workspace(workspace_id: str):
+    """Pinned workspace or 404. Reloading a spilled one runs off the loop."""
+    try:
+        await run_in_threadpool(app.state.workspaces.get, workspace_id)
+    except KeyError:
+        raise HTTPException(404, f"unknown workspace_id {workspace_id}")
+    return app.state.workspaces.use(workspace_id)
 
 # ─────────────────────────── Routes ────────────────────────────────
 @app.get("/healthz", tags=["meta"])
 async def healthz(): return {"status": "ok"}
 
+@app.get("/workspaces", tags=["meta"])
+async def workspaces(): return await run_in_threadpool(app.state.workspaces.stats)
+
+@app.delete("/workspaces/{workspace_id}", tags=["meta"])
+async def delete_workspace(workspace_id: str):
+    with await _workspace(workspace_id): pass
+    app.state.workspaces.delete(workspace_id)
+    return {"workspace_id": workspace_id, "status": "deleted"}
+
 # ---------------- upload ----------------
 @app.post("/upload", tags=["data"])
-async def upload(data_file: UploadFile = File(...)):
+async def upload(data_file: UploadFile = File(...),
+                 workspace_id: Optional[str] = None):
+    """Store a CSV in a new workspace (or replace one) and return its id."""
     if not data_file.filename.endswith(".csv"):
         raise HTTPException(400, "only .csv accepted")
-    try:  df = pd.read_csv(data_file.file)
+    try:  df = await run_in_threadpool(pd.read_csv, data_file.file)
     except Exception as e:
         raise HTTPException(400, f"CSV read error: {e}")
-    app.state.raw_df = df
 
     REQUIRED_CORE = {"user_id", "product_id", "click"}   # everything else optional
     missing = REQUIRED_CORE - set(df.columns)
     if missing:
         raise HTTPException(400, f"Dataset missing required columns: {missing}")
 
-    return {"rows": len(df), "cols": list(df.columns)}
+    if workspace_id is None:
+        workspace_id = app.state.workspaces.create().id
+    with await _workspace(workspace_id) as ws:
+        ws.raw_df       = df
+        ws.df_processed = None
+        ws.features     = None
+        ws.item_embs    = None
+        ws.clear_models()                   # heads trained on the old data
+        ws.cache.clear()
+
+    return {"workspace_id": workspace_id, "rows": len(df), "cols": list(df.columns)}
 
 
 
@@ -133,25 +173,62 @@ def _cleanup(path: Path):
     try: path.unlink(missing_ok=True); path.parent.rmdir()
     except Exception: pass
 
-@app.post("/preprocess", tags=["data"])
-async def preprocess():
-    """Clean the uploaded CSV and cache the result for fine-tuning."""
-    df = app.state.raw_df
-    if df is None:
-        raise HTTPException(400, "Upload a dataset first with /upload")
-
-    pp = Preprocessing(df)
-    processed_df, emb_list = pp.run()         # no on-disk CSV
-
-    # Cache for the fine-tune step
-    app.state.df_processed = processed_df
-    app.state.embeddings   = dict(emb_list)
-
-    return {
-        "detail": "preprocess complete",
-        "rows":   len(processed_df),
-        "cols":   list(processed_df.columns)
-    }
+@app.post("/preprocess", tags=["data"], status_code=202)
+async def preprocess(workspace_id: str):
+    """
+    Queue cleaning of the uploaded CSV on the job pool and return a job id;
+    poll `/preprocess/{job_id}` for stage / percent complete.
+    """
+    with await _workspace(workspace_id) as ws:
+        if ws.raw_df is None:
+            raise HTTPException(400, "Upload a dataset first with /upload")
+
+    def _job(job):
+        with app.state.workspaces.use(workspace_id) as ws:
+            job.progress("matching columns", 1)
+            pp = Preprocessing(ws.raw_df)          # fuzzy matching runs here
+            out_csv = ws.path / "preprocessed_data.csv"
+            out_csv.parent.mkdir(parents=True, exist_ok=True)
+            processed_df, emb_list = pp.run(str(out_csv), progress=job.progress)
+            stats, emb = pp.embedding_stats, dict(emb_list)
+            del pp, emb_list
+
+            # Keep only the feature store for fine-tuning / serving: the
+            # per-row text embeddings are dropped once it is built
+            job.progress("feature store", 96)
+            struct_cols = [c for c in META_COLS if c in processed_df.columns]
+            ws.df_processed = processed_df
+            ws.features     = FeatureStore.from_frame(processed_df, emb, struct_cols)
+            ws.item_embs    = build_item_embeddings(processed_df, emb)
+            ws.clear_models()
+            ws.cache.clear()
+            resident = {"with_row_embeddings": ws.nbytes() + sum(a.nbytes for a in emb.values()),
+                        "resident": ws.nbytes()}
+            del emb
+            print(f"[features] {workspace_id}: resident "
+                  f"{resident['with_row_embeddings'] / 2**20:.1f} MiB → "
+                  f"{resident['resident'] / 2**20:.1f} MiB after dropping per-row embeddings")
+
+            job.progress("cold-start table", 98)
+            _refresh_cold_start(ws, None, BASE_MODEL)
+
+        return {
+            "detail": "preprocess complete",
+            "rows":   len(processed_df),
+            "cols":   list(processed_df.columns),
+            "embedding_stats": stats,
+            "resident_bytes":  resident,
+        }
+
+    job = app.state.jobs.submit("preprocess", _job, workspace_id)
+    return {"job_id": job.id, "workspace_id": workspace_id, "status": job.status}
+
+@app.get("/preprocess/{job_id}", tags=["data"])
+async def preprocess_status(job_id: str):
+    job = app.state.jobs.get(job_id)
+    if job is None or job.kind != "preprocess":
+        raise HTTPException(404, f"unknown job_id {job_id}")
+    return job.to_dict()
 
 # -------------- fine-tune ----------------
 
@@ -159,75 +236,169 @@ EPOCHS_FIXED = 20
 LR_FIXED     = 3e-5
 
 @app.post("/fine_tune", tags=["training"])
-async def fine_tune(bt: BackgroundTasks):
-    """Background fine-tune using 20 epochs, lr=3e-5 (no overrides)."""
-    if any(x is None for x in [app.state.df_processed, app.state.embeddings]):
+async def fine_tune(workspace_id: str, workers: int = 1):
+    """
+    Queue a fine-tune (20 epochs, lr=3e-5, no overrides) on the training
+    pool (RECOAI_TRAIN_WORKERS at a time) and return its job id; poll
+    `/fine_tune/{job_id}` for progress.
+    `workers` > 1 trains data-parallel across that many local CPU processes.
+    """
+    if not 1 <= workers <= (os.cpu_count() or 1):
+        raise HTTPException(400, f"workers must be in 1..{os.cpu_count()}")
+    with await _workspace(workspace_id) as ws:
+        if ws.df_processed is None or ws.features is None:
+            raise HTTPException(400, "Run /preprocess first")
+
+    def _job(job):
+        job_id = job.id
+        with app.state.workspaces.use(workspace_id) as ws:
+            df   = ws.df_processed
+            generation = ws.generation
+            job.progress("dataset", 2)
+
+            # ----- dataset prep ------------------------------------------------
+            store = ws.features                      # shared with serving
+            store.log_footprint(job_id)
+
+            y      = df["click"].values
+            dft, dfv, yt, yv, rows_t, rows_v = train_test_split(
+                df, y, np.arange(len(df)), test_size=0.2, random_state=42
+            )
+            tr_ds = RecommenderDataset(dft, store, yt, rows_t)
+            vl_ds = RecommenderDataset(dfv, store, yv, rows_v)
+
+            # ----- model -------------------------------------------------------
+            model = tenant_model()                      # CF tower shared, frozen
+            for p in model.cf.parameters(): p.requires_grad = False
+            own = {k: v for k, v in CKPT.items() if not k.startswith("cf.")}
+            safe_load_pretrained(model, own, skip_embeddings=True)
+
+            job.progress("training", 5)
+            if workers > 1:
+                res = fine_tune_distributed(
+                    model, tr_ds, vl_ds, yt, workers, EPOCHS_FIXED, LR_FIXED,
+                    BATCH_SIZE, AUX_WEIGHT, tag=job_id,
+                )
+                best_state, best_auc = res["state"], res["auc"]
+            else:
+                device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+                best_state, best_auc = run_fine_tune(
+                    model, tr_ds, vl_ds, yt, EPOCHS_FIXED, LR_FIXED, BATCH_SIZE,
+                    AUX_WEIGHT, device, log=lambda m: print(f"[{job_id}] {m}"),
+                )
+
+            # keep best weights, switch to eval, store in RAM
+            job.progress("saving", 95)
+            if best_state is not None:
+                model.load_state_dict(best_state, strict=False)
+            model.eval()
+            if ws.generation != generation:
+                raise RuntimeError("dataset was replaced during fine-tuning")
+            ws.ft_models[job_id] = model
+            ws.cache.pop(("retriever", job_id), None)
+            ws.cache.pop(("user_state", job_id), None)
+            _refresh_cold_start(ws, job_id, model)
+            print(f"[{job_id}] fine-tune complete (best AUC={best_auc:.4f})")
+        return {"best_auc": float(best_auc), "workers": workers}
+
+    job = app.state.jobs.submit("fine_tune", _job, workspace_id)
+    return {"job_id": job.id, "workspace_id": workspace_id,
+            "workers": workers, "status": job.status}
+
+@app.get("/fine_tune/{job_id}", tags=["training"])
+async def fine_tune_status(job_id: str):
+    job = app.state.jobs.get(job_id)
+    if job is None or job.kind != "fine_tune":
+        raise HTTPException(404, f"unknown job_id {job_id}")
+    return job.to_dict()
+
+# -------------- recommend ----------------
+def _serving_model(ws, job_id: Optional[str]):
+    if ws.df_processed is None or ws.features is None:
         raise HTTPException(400, "Run /preprocess first")
-
-    job_id = uuid.uuid4().hex
-
-    def _job():
-        df   = app.state.df_processed
-        emb  = app.state.embeddings
-
-        # ----- dataset prep ------------------------------------------------
-        BASE_STRUCT = ["price_scaled", "sentiment",
-               "category_encoded", "color_encoded", "material_encoded"]
-
-        struct_cols = [c for c in BASE_STRUCT if c in df.columns]
-        X_meta      = build_meta_matrix(df, emb, struct_cols)
-
-        y      = df["click"].values
-        dft, dfv, yt, yv, Xm_t, Xm_v = train_test_split(
-            df, y, X_meta, test_size=0.2, random_state=42
-        )
-        tr_ds, vl_ds = RecommenderDataset(dft, Xm_t, yt), RecommenderDataset(dfv, Xm_v, yv)
-        weights = 1.0 / np.bincount(yt)
-        sampler = WeightedRandomSampler(weights[yt], len(yt), replacement=True)
-        tl, vl  = DataLoader(tr_ds, BATCH_SIZE, sampler=sampler), DataLoader(vl_ds, BATCH_SIZE)
-
-        # ----- model -------------------------------------------------------
-        model = copy.deepcopy(BASE_MODEL)
-        for p in model.cf.parameters(): p.requires_grad = False
-        safe_load_pretrained(model, CKPT, skip_embeddings=True)
-
-        device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-        model.to(device)
-        opt  = torch.optim.Adam(filter(lambda p: p.requires_grad, model.parameters()), lr=LR_FIXED)
-        crit = torch.nn.BCEWithLogitsLoss()
-
-        best_auc, best_state = 0.0, None
-        for ep in range(EPOCHS_FIXED):
-            model.train(); running = 0.0
-            for bx, yb in tl:
-                bx = {k: v.to(device) for k, v in bx.items()}
-                yb = yb.to(device)
-                opt.zero_grad()
-                logits, aux = model(bx)
-                loss = crit(logits, yb) + AUX_WEIGHT * crit(aux, yb)
-                loss.backward(); opt.step(); running += loss.item()
-
-            # quick val
-            model.eval(); yt, yp = [], []
-            with torch.no_grad():
-                for bx, yb in vl:
-                    bx = {k: v.to(device) for k, v in bx.items()}
-                    preds, _ = model(bx)
-                    yt.extend(yb.numpy())
-                    yp.extend(torch.sigmoid(preds).cpu().numpy())
-            auc = roc_auc_score(yt, yp)
-            print(f"[{job_id}] ep {ep+1}/20 loss {running/len(tl):.4f}  auc {auc:.4f}")
-            if auc > best_auc:
-                best_auc, best_state = auc, model.state_dict()
-
-        # keep best weights, switch to eval, store in RAM
-        model.load_state_dict(best_state or model.state_dict())
-        model.eval()
-        app.state.ft_models[job_id] = model
-        print(f"[{job_id}] fine-tune complete (best AUC={best_auc:.4f})")
-
-    bt.add_task(_job)
-    return {"job_id": job_id, "status": "running"}
+    if job_id is None:
+        return BASE_MODEL
+    if ws.ft_models.get(job_id) is not None:
+        return ws.ft_models[job_id]
+    raise HTTPException(404, f"unknown or unfinished job_id {job_id}")
+
+def _refresh_cold_start(ws, job_id: Optional[str], model) -> ColdStartTable:
+    """(Re)build the new-user ranking for this dataset / model version."""
+    table = ColdStartTable.build(ws.df_processed, model, ws.features,
+                                 version=job_id or "base")
+    ws.cache[("cold_start", job_id)] = table
+    return table
+
+def _cold_start(ws, job_id: Optional[str], model) -> ColdStartTable:
+    return ws.cache.get(("cold_start", job_id)) or _refresh_cold_start(ws, job_id, model)
+
+def _user_states(ws, job_id: Optional[str], model) -> UserStateCache:
+    key = ("user_state", job_id)
+    if key not in ws.cache:
+        ws.cache[key] = UserStateCache(model, budget=USER_STATE_BUDGET)
+    cache = ws.cache[key]
+    cache.ensure_model(model)
+    return cache
+
+@app.get("/recommend", tags=["serving"])
+async def recommend(workspace_id: str, user_id: int, k: int = 5,
+                    job_id: Optional[str] = None, category: Optional[int] = None):
+    """
+    Top-k items for `user_id` (u_idx) using a fine-tuned head or the base model.
+    Users without history get the precomputed cold-start ranking, optionally
+    restricted to `category` (category_encoded).
+    """
+    with await _workspace(workspace_id) as ws:
+        model = _serving_model(ws, job_id)
+        df = ws.df_processed
+
+        def _score():
+            cold = _cold_start(ws, job_id, model)
+            if cold.is_new(user_id):                 # O(K), skip everything else
+                return cold.top_k(k, category)
+            store = ws.features
+            key = ("retriever", job_id)
+            if key not in ws.cache:
+                ws.cache[key] = CandidateRetriever(model, df, **RETRIEVE_BUDGETS)
+            if "item_maps" not in ws.cache:
+                ws.cache["item_maps"] = build_item_maps(df)
+            return hybrid_topk_recommendation(
+                model, user_id, df, store, None,
+                ws.item_embs, top_k_items=k, retriever=ws.cache[key],
+                state_cache=_user_states(ws, job_id, model),
+                item_maps=ws.cache["item_maps"],
+            )
+
+        recs = await run_in_threadpool(_score)
+
+    recs = [{k: (v.item() if isinstance(v, np.generic) else v) for k, v in r.items()}
+            for r in recs]
+
+    return {"workspace_id": workspace_id, "user_id": user_id,
+            "recommendations": recs}
+
+@app.post("/interactions", tags=["serving"])
+async def add_interaction(workspace_id: str, user_id: int, item_id: int,
+                          job_id: Optional[str] = None):
+    """
+    Record a session click: advances the user's cached interest state by
+    one GRU step so the next /recommend reflects it without re-encoding.
+    """
+    with await _workspace(workspace_id) as ws:
+        model = _serving_model(ws, job_id)
+        df = ws.df_processed
+        user_df = df[df["u_idx"] == user_id]
+        if user_df.empty:
+            raise HTTPException(404, f"user {user_id} has no stored history")
+        if not 0 <= item_id <= int(df["i_idx"].max()):
+            raise HTTPException(400, f"unknown item_id {item_id}")
+
+        cache = _user_states(ws, job_id, model)
+        base  = user_df["seq"].iloc[0]
+        await run_in_threadpool(cache.append, user_id, base, [item_id])
+
+    return {"workspace_id": workspace_id, "user_id": user_id,
+            "item_id": item_id, "cache": cache.stats()}
 
 # ─────────────────────────── Local run ─────────────────────────────
 if __name__ == "__main__":
@@ -11,6 +11,10 @@ Only the model classes live here—no training loops or data code.
 """
 
 from __future__ import annotations
+import hashlib, math, os, shutil, tempfile
+from pathlib import Path
+
+import numpy as np
 import torch
 import torch.nn as nn
 import torch.nn.functional as F
@@ -44,6 +48,170 @@ class AUGRUCell(nn.Module):
         return h_t
 
 
+# ────────────────────────────────────────────────────────────────────────────
+#  Embedding backends (drop-in for nn.Embedding lookups)
+# ────────────────────────────────────────────────────────────────────────────
+
+class QREmbedding(nn.Module):
+    """
+    Quotient-remainder compositional embedding (Shi et al., 2020).
+    Row i = E_q[i // m] * E_r[i % m]; two tables of ~sqrt(N) rows replace
+    one of N.  Must be trained – it cannot be converted from a dense table.
+    """
+    def __init__(self, num_embeddings: int, embedding_dim: int,
+                 num_buckets: int | None = None):
+        super().__init__()
+        self.num_embeddings = num_embeddings
+        self.embedding_dim  = embedding_dim
+        self.m = num_buckets or max(1, math.ceil(math.sqrt(num_embeddings)))
+        n_q = math.ceil(num_embeddings / self.m)
+        self.q_emb = nn.Embedding(n_q,    embedding_dim)
+        self.r_emb = nn.Embedding(self.m, embedding_dim)
+        nn.init.normal_(self.q_emb.weight, 1.0, 0.1)    # product ≈ r_emb at init
+
+    def forward(self, idx: torch.Tensor) -> torch.Tensor:
+        return self.q_emb(idx // self.m) * self.r_emb(idx % self.m)
+
+
+class QuantizedEmbedding(nn.Module):
+    """
+    Read-only fp16 or row-wise int8 table for inference.
+    Loads transparently from a dense `weight` entry in a checkpoint.
+    """
+    def __init__(self, num_embeddings: int, embedding_dim: int,
+                 dtype: str = "int8"):
+        super().__init__()
+        if dtype not in ("int8", "fp16"):
+            raise ValueError(f"unsupported dtype {dtype!r}")
+        self.num_embeddings = num_embeddings
+        self.embedding_dim  = embedding_dim
+        self.dtype = dtype
+        store = torch.int8 if dtype == "int8" else torch.float16
+        self.register_buffer("q", torch.zeros(num_embeddings, embedding_dim, dtype=store))
+        self.register_buffer("scale", torch.ones(num_embeddings if dtype == "int8" else 0))
+
+    @torch.no_grad()
+    def copy_dense_(self, weight: torch.Tensor) -> "QuantizedEmbedding":
+        weight = weight.float()
+        if self.dtype == "fp16":
+            self.q.copy_(weight.half())
+        else:
+            scale = weight.abs().amax(dim=1).clamp_min(1e-8) / 127.0
+            self.q.copy_(torch.round(weight / scale[:, None]).to(torch.int8))
+            self.scale.copy_(scale)
+        return self
+
+    def _load_from_state_dict(self, state_dict, prefix, *args, **kwargs):
+        dense = state_dict.pop(prefix + "weight", None)
+        if dense is not None and dense.shape == self.q.shape:
+            self.copy_dense_(dense)
+            state_dict[prefix + "q"]     = self.q
+            state_dict[prefix + "scale"] = self.scale
+        super()._load_from_state_dict(state_dict, prefix, *args, **kwargs)
+
+    def forward(self, idx: torch.Tensor) -> torch.Tensor:
+        rows = self.q[idx].float()
+        if self.dtype == "int8":
+            rows = rows * self.scale[idx].unsqueeze(-1)
+        return rows
+
+
+class MemmapEmbedding(nn.Module):
+    """
+    Read-only table memory-mapped from a `.npy` file (see
+    `export_embedding_tables`).  Only the pages actually looked up become
+    resident, and every process mapping the file shares them.
+    """
+    def __init__(self, path: str | Path):
+        super().__init__()
+        self.path  = str(path)
+        self.table = np.load(self.path, mmap_mode="r")
+        self.num_embeddings, self.embedding_dim = self.table.shape
+
+    def _load_from_state_dict(self, state_dict, prefix, *args, **kwargs):
+        state_dict.pop(prefix + "weight", None)          # served from disk
+        super()._load_from_state_dict(state_dict, prefix, *args, **kwargs)
+
+    def __getstate__(self):
+        state = self.__dict__.copy(); state["table"] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.table = np.load(self.path, mmap_mode="r")
+
+    def forward(self, idx: torch.Tensor) -> torch.Tensor:
+        rows = self.table[idx.cpu().numpy()]             # copies only these rows
+        return torch.from_numpy(np.asarray(rows, dtype=np.float32)).to(idx.device)
+
+
+EMB_BACKENDS = ("dense", "qr", "fp16", "int8", "mmap")
+
+def make_embedding(name: str, num: int, dim: int,
+                   backend: str = "dense", **kw) -> nn.Module:
+    """
+    Build one of the DIEN id tables.
+      dense – nn.Embedding (default, trainable)
+      qr    – QREmbedding, kw: qr_buckets
+      fp16 / int8 – QuantizedEmbedding (inference); int8 falls back to fp16
+                    for 1-wide bias tables where a row scale would cost more
+      mmap  – MemmapEmbedding, kw: mmap_dir containing `<name>.npy`
+    """
+    if backend == "dense":
+        return nn.Embedding(num, dim)
+    if backend == "qr":
+        return QREmbedding(num, dim, kw.get("qr_buckets"))
+    if backend in ("fp16", "int8"):
+        return QuantizedEmbedding(num, dim, "fp16" if dim == 1 else backend)
+    if backend == "mmap":
+        emb = MemmapEmbedding(Path(kw["mmap_dir"]) / f"{name}.npy")
+        if emb.table.shape != (num, dim):
+            raise ValueError(f"{emb.path}: shape {emb.table.shape} != {(num, dim)}")
+        return emb
+    raise ValueError(f"unknown embedding backend {backend!r}; choose from {EMB_BACKENDS}")
+
+def embedding_matrix(emb: nn.Module) -> torch.Tensor:
+    """Full [N, D] float table for any backend (e.g. for retrieval indexes)."""
+    if isinstance(emb, nn.Embedding):
+        return emb.weight.detach()
+    with torch.no_grad():
+        device = next(emb.buffers(), next(emb.parameters(), torch.empty(0))).device
+        return emb(torch.arange(emb.num_embeddings, device=device))
+
+EMB_TABLES = ("user_emb", "item_emb", "user_bias", "item_bias")
+
+def export_embedding_tables(state: dict, out_dir: str | Path,
+                            prefix: str = "cf.") -> Path:
+    """Write the dense DIEN id tables of a checkpoint as `.npy` for `mmap`."""
+    out_dir = Path(out_dir); out_dir.mkdir(parents=True, exist_ok=True)
+    for name in EMB_TABLES:
+        w = state[f"{prefix}{name}.weight"].detach().cpu().float().numpy()
+        np.save(out_dir / f"{name}.npy", w)
+    return out_dir
+
+def cached_embedding_tables(state: dict, ckpt_path: str | Path,
+                            cache_root: str | Path, prefix: str = "cf.") -> Path:
+    """
+    `export_embedding_tables` into `cache_root/<ckpt stem>-<content hash>`,
+    reusing an earlier export of the same checkpoint file. Replacing the
+    checkpoint (even with one of the same shape) gets a fresh directory.
+    """
+    digest = hashlib.sha1()
+    with open(ckpt_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    cache_root = Path(cache_root); cache_root.mkdir(parents=True, exist_ok=True)
+    out = cache_root / f"{Path(ckpt_path).stem}-{digest.hexdigest()[:16]}"
+    if not out.exists():                     # export aside, then publish atomically
+        tmp = Path(tempfile.mkdtemp(prefix=".export-", dir=cache_root))
+        export_embedding_tables(state, tmp, prefix)
+        try:
+            os.rename(tmp, out)
+        except OSError:                      # another process published first
+            shutil.rmtree(tmp, ignore_errors=True)
+    return out
+
+
 # ────────────────────────────────────────────────────────────────────────────
 #  DIEN-style Collaborative Tower
 # ────────────────────────────────────────────────────────────────────────────
@@ -59,12 +227,15 @@ class DIENCollaborative(nn.Module):
                  n_users:   int,
                  n_items:   int,
                  emb_dim:   int,
-                 seq_len:   int):
+                 seq_len:   int,
+                 emb_backend: str = "dense",
+                 **emb_kw):
         super().__init__()
-        self.user_emb   = nn.Embedding(n_users,        emb_dim)
-        self.item_emb   = nn.Embedding(n_items + 1,    emb_dim)  # +1 for PAD
-        self.user_bias  = nn.Embedding(n_users, 1)
-        self.item_bias  = nn.Embedding(n_items, 1)
+        mk = lambda name, n, d: make_embedding(name, n, d, emb_backend, **emb_kw)
+        self.user_emb   = mk("user_emb",  n_users,     emb_dim)
+        self.item_emb   = mk("item_emb",  n_items + 1, emb_dim)  # +1 for PAD
+        self.user_bias  = mk("user_bias", n_users,     1)
+        self.item_bias  = mk("item_bias", n_items,     1)
 
         self.gru         = nn.GRU(emb_dim, emb_dim, batch_first=True)
         self.attn_linear = nn.Linear(emb_dim, emb_dim)
@@ -75,24 +246,40 @@ class DIENCollaborative(nn.Module):
         self.seq_len = seq_len
 
     # --------------------------------------------------------------------- #
+    def encode_history(self, seq: torch.Tensor
+                       ) -> tuple[torch.Tensor, torch.Tensor, torch.Tensor]:
+        """
+        Target-independent part of the tower, reusable across candidates.
+        Returns seq_emb [B,T,D], gru_out [B,T,D], h_n [1,B,D].
+        """
+        seq_emb = self.item_emb(seq)
+        gru_out, h_n = self.gru(seq_emb)
+        return seq_emb, gru_out, h_n
+
     def forward(self,
                 u_idx: torch.Tensor,          # [B]
                 i_idx: torch.Tensor,          # [B]
-                seq:  torch.Tensor) -> tuple[torch.Tensor, torch.Tensor, torch.Tensor]:
+                seq:  torch.Tensor,
+                history: tuple[torch.Tensor, torch.Tensor] | None = None
+                ) -> tuple[torch.Tensor, torch.Tensor, torch.Tensor]:
         """
+        `history` = precomputed (seq_emb, gru_out) from `encode_history`;
+        when given, `seq` is not re-embedded or re-run through the GRU.
+
         Returns:
             fm1        – first-order bias term  [B, 1]
             attn_vec   – interest vector        [B, D]
             aux_logits – auxiliary click logits [B] (float)
         """
         # ---------- Bias term (first-order FM) ----------------------------
-        fm1 = (self.user_bias(u_idx) + self.item_bias(i_idx)).squeeze(2)  # [B, 1]
+        fm1 = (self.user_bias(u_idx) + self.item_bias(i_idx)).reshape(-1, 1)  # [B, 1]
 
         # ---------- Item sequence processing ------------------------------
         target_emb = self.item_emb(i_idx)        # [B, D]
-        seq_emb    = self.item_emb(seq)          # [B, T, D]
-
-        gru_out, _ = self.gru(seq_emb)           # [B, T, D]
+        if history is None:
+            seq_emb, gru_out, _ = self.encode_history(seq)   # [B, T, D] each
+        else:
+            seq_emb, gru_out = history
 
         # Attention weights
         target_proj = self.attn_linear(target_emb).unsqueeze(1)  # [B,1,D]
@@ -101,7 +288,7 @@ class DIENCollaborative(nn.Module):
 
         # AUGRU
         h = torch.zeros_like(target_emb)
-        for t in range(seq.shape[1]):
+        for t in range(seq_emb.shape[1]):
             h = self.augru_cell(seq_emb[:, t, :], h, attn_weights[:, t])
         attn_vec = h                                            # [B, D]
 
@@ -151,11 +338,18 @@ class HybridDeepFM(nn.Module):
                  emb_dim:   int,
                  meta_dim:  int,
                  hidden_dim:int = 64,
-                 seq_len:   int = 50):
+                 seq_len:   int = 50,
+                 emb_backend: str = "dense",
+                 **emb_kw):
+        """
+        `emb_backend` selects how the CF id tables are stored – see
+        `make_embedding`. Extra keyword args (qr_buckets, mmap_dir) go there.
+        """
         super().__init__()
 
         # Collaborative (DIEN) side
-        self.cf = DIENCollaborative(n_users, n_items, emb_dim, seq_len)
+        self.cf = DIENCollaborative(n_users, n_items, emb_dim, seq_len,
+                                    emb_backend, **emb_kw)
         self.cf_dim = 1 + emb_dim                          # fm1 (1) + attn_vec (D)
 
         # Content side
@@ -170,6 +364,16 @@ class HybridDeepFM(nn.Module):
             nn.Linear(hidden_dim, 1)         # logits
         )
 
+        # Bumped whenever this model's weights are replaced; caches derived
+        # from the model (e.g. `UserStateCache`) compare it instead of
+        # tensor versions, which shared towers bump for every tenant.
+        self.version = 0
+
+    def load_state_dict(self, *args, **kwargs):
+        result = super().load_state_dict(*args, **kwargs)
+        self.version += 1
+        return result
+
     # --------------------------------------------------------------------- #
     def forward(self, batch: dict[str, torch.Tensor]) -> tuple[torch.Tensor, torch.Tensor]:
         """
@@ -179,11 +383,16 @@ class HybridDeepFM(nn.Module):
               • i_idx  – [B] long
               • seq    – [B,T] long
               • meta   – [B, meta_dim] float
+            optional (precomputed history, e.g. from a user-state cache):
+              • seq_emb, gru_out – [B, T, D] float
         Returns:
             logits (main head) ,  aux_logits (DIEN auxiliary)
         """
+        history = None
+        if "gru_out" in batch:
+            history = (batch["seq_emb"], batch["gru_out"])
         fm1, attn_vec, aux_logits = self.cf(
-            batch["u_idx"], batch["i_idx"], batch["seq"]
+            batch["u_idx"], batch["i_idx"], batch.get("seq"), history
         )
         cf_out = torch.cat([fm1, attn_vec], dim=1)   # [B, cf_dim]
         cb_out = self.cb(batch["meta"])              # [B, hidden_dim]
@@ -3,15 +3,17 @@
 import pandas as pd
 import numpy as np
 import re
+from pathlib import Path
 from sklearn.preprocessing import StandardScaler, LabelEncoder
 from fuzzywuzzy import process
 from sklearn.model_selection import train_test_split
 import torch
 from torch.utils.data import Dataset, DataLoader, WeightedRandomSampler
-from typing import Dict, List, Optional
+from typing import Callable, Dict, List, Optional
 
 # Global, shared model objects
-from backend.core_models import EMBEDDER, SENTIMENT
+from backend.core_models import EMBEDDER, SENTIMENT, EMBED_PIPELINE
+from backend.text_embedding import EmbeddingPipeline
 
 # --------------------------------------------------------------------------- #
 #                               Preprocessing                                 #
@@ -28,6 +30,7 @@ class Preprocessing:
         df: pd.DataFrame,
         embedder=EMBEDDER,
         sentiment_analyzer=SENTIMENT,
+        embedding_pipeline: Optional[EmbeddingPipeline] = None,
     ):
         self.df = df.copy()
 
@@ -38,6 +41,11 @@ class Preprocessing:
         # Heavy objects come from the singleton module
         self.embedder = embedder
         self.sentiment_analyzer = sentiment_analyzer
+        # the shared env-configured pipeline wraps EMBEDDER; an injected
+        # embedder gets its own pipeline in `_generate_embeddings`
+        if embedding_pipeline is None and embedder is EMBEDDER:
+            embedding_pipeline = EMBED_PIPELINE
+        self.embedding_pipeline = embedding_pipeline
 
         # Column-matching configuration
         self.required_cols = {
@@ -62,6 +70,8 @@ class Preprocessing:
 
         # Will hold key → np.ndarray for embeddings
         self.embeddings: dict[str, np.ndarray] = {}
+        self.embedding_stats: dict[str, dict] = {}
+        self._progress: Callable[[str, float], None] = lambda stage, pct: None
 
     # --------------------------------------------------------------------- #
     #                           Column Matching                              #
@@ -98,9 +108,14 @@ class Preprocessing:
     def _perform_sentiment_analysis(self) -> None:
         review_col = self.matched_cols.get("review")
         if review_col:
-            self.df["sentiment"] = self.df[review_col].astype(str).apply(
-                lambda x: self.sentiment_analyzer.polarity_scores(x)["compound"]
-            )
+            reviews = self.df[review_col].astype(str).tolist()
+            scores = np.empty(len(reviews), dtype="float64")
+            step = max(1, len(reviews) // 50)
+            for i, text in enumerate(reviews):
+                scores[i] = self.sentiment_analyzer.polarity_scores(text)["compound"]
+                if i % step == 0:
+                    self._progress("sentiment", 10 + 20 * i / len(reviews))
+            self.df["sentiment"] = scores
 
     def _scale_numericals(self) -> None:
         scale_candidates = {
@@ -125,13 +140,25 @@ class Preprocessing:
                     self.df["category_encoded"] = self.df[f"{key}_encoded"]
 
     def _generate_embeddings(self) -> None:
-        for key in ["review", "product_title", "features"]:
-            col = self.matched_cols.get(key)
-            if col and col in self.df.columns:
-                sentences = self.df[col].astype(str).tolist()
-                self.embeddings[key] = self.embedder.encode(
-                    sentences, show_progress_bar=True
-                )
+        pipeline = self.embedding_pipeline or EmbeddingPipeline(self.embedder)
+        fields = [k for k in ["review", "product_title", "features"]
+                  if self.matched_cols.get(k) in self.df.columns]
+        try:
+            for n, key in enumerate(fields):
+                col = self.matched_cols[key]
+                # encode each distinct text once: rows of one product then get
+                # bit-identical title / feature vectors (and repeats are free)
+                texts, inverse = np.unique(self.df[col].astype(str).to_numpy(),
+                                           return_inverse=True)
+                lo, span = 45 + 50 * n / len(fields), 50 / len(fields)
+                self.embeddings[key] = pipeline.encode(
+                    key, texts.tolist(),
+                    progress=lambda f, k=key: self._progress(f"embedding {k}", lo + span * f),
+                    stats=self.embedding_stats,
+                )[inverse.reshape(-1)]
+        finally:
+            if pipeline is not self.embedding_pipeline:
+                pipeline.close()
 
     def _standardize_column_names(self) -> None:
         for std_name, original in self.matched_cols.items():
@@ -143,10 +170,18 @@ class Preprocessing:
     #                          Pipeline Orchestrator                         #
     # --------------------------------------------------------------------- #
 
-    def run(self, output_csv: str = "preprocessed_data.csv"):
-        """Execute full pipeline, persist CSV & .npy files, return processed df."""
+    def run(self, output_csv: str = "preprocessed_data.csv",
+            progress: Optional[Callable[[str, float], None]] = None):
+        """
+        Execute full pipeline, persist CSV & .npy files, return processed df.
+        `progress(stage, percent)` is called as the pipeline advances.
+        """
+        self._progress = progress or (lambda stage, pct: None)
+
+        self._progress("cleaning", 5)
         self._standardize_column_names()
         self._drop_nulls_duplicates()
+        self._progress("sentiment", 10)
         self._perform_sentiment_analysis()
 
         # Ensure user_id exists
@@ -156,6 +191,7 @@ class Preprocessing:
             self.matched_cols["user_id"] = "user_id"
 
         # Build index columns
+        self._progress("indexing", 30)
         self.df["u_idx"] = self.df["user_id"].astype("category").cat.codes
         self.df["i_idx"] = self.df["product_id"].astype("category").cat.codes
 
@@ -172,10 +208,14 @@ class Preprocessing:
 
             return self.df["u_idx"].map(get_seq)
 
+        self._progress("sequences", 33)
         self.df["seq"] = build_sequence()
+        self._progress("encoding", 40)
         self._scale_numericals()
         self._encode_categoricals()
+        self._progress("embeddings", 45)
         self._generate_embeddings()
+        self._progress("saving", 96)
 
         # --------------------------------------------------------------- #
         #                Select final columns for training                #
@@ -219,8 +259,9 @@ class Preprocessing:
         self.df.to_csv(output_csv, index=False)
 
         # Save embeddings
+        out_dir = Path(output_csv).parent
         for key, arr in self.embeddings.items():
-            np.save(f"{key}_embeddings.npy", arr)
+            np.save(out_dir / f"{key}_embeddings.npy", arr)
 
         return self.df, list(self.embeddings.items())
 
@@ -0,0 +1,283 @@
+# backend/retrieval.py
+"""
+Candidate retrieval stage that sits in front of the DeepFM ranker.
+
+Scoring every unseen item with the full `HybridDeepFM` forward pass is linear
+in catalog size per request.  `CandidateRetriever` narrows the catalog to a
+few hundred items by merging three cheap sources:
+
+• Embedding   – dot product between the user query and `cf.item_emb`
+• Neighbour   – items liked by the nearest CF users
+• Popular     – globally most-interacted items (fills the remaining budget)
+
+Only the merged candidates are passed to the ranker. Recall of the
+candidate set against exhaustive scoring:
+
+    python -m backend.retrieval --ckpt backend/new_dien.pth \\
+        --data preprocessed_data.csv --embedding 200 --neighbour 100 --popular 50
+"""
+
+from __future__ import annotations
+import argparse, ast, json, threading, weakref
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+import pandas as pd
+import torch
+from scipy.sparse import csr_matrix
+from sklearn.neighbors import NearestNeighbors
+
+from backend.model import embedding_matrix
+from backend.top_k import build_meta_lookup, score_items
+
+
+# One float32 item table per embedding module, shared by every retriever
+# over it. Tenant models share the frozen CF tower, so this is built once
+# per process instead of once per (workspace, job). For the dense backend it
+# is a view of the weights; compact backends pay one decoded copy in total.
+_ITEM_INDEX: "weakref.WeakKeyDictionary[torch.nn.Module, np.ndarray]" = \
+    weakref.WeakKeyDictionary()
+_ITEM_INDEX_LOCK = threading.Lock()
+
+def item_index(item_emb: torch.nn.Module) -> np.ndarray:
+    """[n_items + 1, D] float32 rows of `item_emb` (last row = PAD)."""
+    with _ITEM_INDEX_LOCK:
+        rows = _ITEM_INDEX.get(item_emb)
+        if rows is None:
+            rows = embedding_matrix(item_emb).float().cpu().numpy()
+            _ITEM_INDEX[item_emb] = rows
+        return rows
+
+
+class CandidateRetriever:
+    """
+    Built once per (dataset, model) pair; `retrieve` is then a handful of
+    vector ops per request.
+    """
+    def __init__(self,
+                 model,
+                 df:             pd.DataFrame,
+                 n_embedding:    int = 200,
+                 n_neighbour:    int = 100,
+                 n_popular:      int = 50,
+                 top_n_users:    int = 10,
+                 like_threshold: int = 4):
+        self.n_embedding    = n_embedding
+        self.n_neighbour    = n_neighbour
+        self.n_popular      = n_popular
+        self.top_n_users    = top_n_users
+        self.like_threshold = like_threshold
+
+        cf = model.cf
+        self.pad_token = int(df["i_idx"].max()) + 1
+
+        # ---------- dot-product index over trained embedding tables -------
+        # users are looked up per request through the embedding module, items
+        # come from the process-wide shared index – nothing per-tenant is decoded
+        self.user_emb  = cf.user_emb
+        self.device    = next(cf.parameters()).device
+        self.item_rows = item_index(cf.item_emb)
+        n_rows = self.item_rows.shape[0] - 1                 # last row = PAD
+
+        items = np.sort(df["i_idx"].unique())
+        self.item_ids  = items[items < n_rows].astype(np.int64)
+
+        # ---------- popularity ------------------------------------------
+        self.popular = df["i_idx"].value_counts().index.to_numpy(dtype=np.int64)
+
+        # ---------- CF neighbours (fit once, not per request) -------------
+        # same rating-valued user×item matrix as `top_k._cf_item_scores`
+        value_col = "rating" if "rating" in df.columns else "click"
+        if value_col == "rating":
+            df_like = df[df["rating"] >= like_threshold]
+        else:
+            df_like = df[df["click"] > 0]
+        self._df_like = df_like
+
+        self.user_to_row: Dict[int, int] = {}
+        self._knn = None
+        if not df_like.empty:
+            cells = df_like.groupby(["u_idx", "i_idx"])[value_col].mean()  # pivot_table's mean
+            users = pd.Categorical(cells.index.get_level_values("u_idx"))
+            n_cols = int(df["i_idx"].max()) + 1
+            self._uim = csr_matrix(
+                (cells.to_numpy(dtype=np.float32),
+                 (users.codes, cells.index.get_level_values("i_idx").to_numpy())),
+                shape=(len(users.categories), n_cols),
+            )
+            self.user_to_row = {int(u): i for i, u in enumerate(users.categories)}
+            self.row_to_user = np.asarray(users.categories, dtype=np.int64)
+            self._knn = NearestNeighbors(metric="cosine").fit(self._uim)
+
+    # --------------------------------------------------------------------- #
+    @torch.no_grad()
+    def _query(self, user_id: int, user_seq: Optional[Iterable[int]]) -> np.ndarray:
+        """User vector + mean of history item vectors (PAD ignored)."""
+        q = np.zeros(self.item_rows.shape[1], dtype=np.float32)
+        if 0 <= user_id < self.user_emb.num_embeddings:
+            idx = torch.tensor([user_id], dtype=torch.long, device=self.device)
+            q += self.user_emb(idx)[0].float().cpu().numpy()
+        if user_seq is not None:
+            hist = np.asarray(list(user_seq), dtype=np.int64)
+            hist = hist[(hist != self.pad_token) & (hist < self.item_rows.shape[0] - 1)]
+            if hist.size:
+                q += self.item_rows[hist].mean(axis=0)
+        return q
+
+    def embedding_candidates(self, user_id: int, user_seq=None,
+                             n: Optional[int] = None) -> np.ndarray:
+        n = self.n_embedding if n is None else n
+        if n <= 0 or not len(self.item_ids):
+            return np.empty(0, dtype=np.int64)
+        scores = (self.item_rows @ self._query(user_id, user_seq))[self.item_ids]
+        n = min(n, len(scores))
+        top = np.argpartition(-scores, n - 1)[:n]
+        top = top[np.argsort(-scores[top])]
+        return self.item_ids[top]
+
+    def neighbour_item_scores(self, user_id: int,
+                              top_n_users: Optional[int] = None) -> Dict[int, float]:
+        """Normalised like-frequency of items among the nearest CF users."""
+        if self._knn is None or user_id not in self.user_to_row:
+            return {}
+        top_n_users = self.top_n_users if top_n_users is None else top_n_users
+        row = self.user_to_row[user_id]
+        k_users = min(top_n_users + 1, self._uim.shape[0])
+        idxs = self._knn.kneighbors(self._uim[row], n_neighbors=k_users,
+                                    return_distance=False)[0]
+        sim_users = [self.row_to_user[i] for i in idxs if i != row][:top_n_users]
+        neigh_df = self._df_like[self._df_like["u_idx"].isin(sim_users)]
+        return neigh_df["i_idx"].value_counts(normalize=True).to_dict()
+
+    # --------------------------------------------------------------------- #
+    def retrieve(self,
+                 user_id:  int,
+                 user_seq: Optional[Iterable[int]] = None,
+                 seen:     Iterable[int] = (),
+                 item_scores: Optional[Dict[int, float]] = None) -> List[int]:
+        """
+        Ordered, de-duplicated candidate list (embedding → neighbour →
+        popular), excluding `seen`. Total size ≤ sum of the three budgets.
+        """
+        seen = set(int(i) for i in seen)
+        out: List[int] = []
+        taken = set()
+
+        def _take(source, budget):
+            added = 0
+            for i in source:
+                if added >= budget:
+                    break
+                i = int(i)
+                if i in seen or i in taken:
+                    continue
+                taken.add(i); out.append(i); added += 1
+
+        # over-fetch so the budget survives filtering of seen items
+        _take(self.embedding_candidates(user_id, user_seq,
+                                        self.n_embedding + len(seen)),
+              self.n_embedding)
+
+        if item_scores is None:
+            item_scores = self.neighbour_item_scores(user_id)
+        neigh = sorted(item_scores, key=item_scores.get, reverse=True)
+        _take(neigh, self.n_neighbour)
+
+        _take(self.popular, self.n_popular)
+        return out
+
+
+# ────────────────────────────────────────────────────────────────────────────
+#  Retrieval quality
+# ────────────────────────────────────────────────────────────────────────────
+
+def retrieval_recall(model,
+                     retriever: CandidateRetriever,
+                     df:        pd.DataFrame,
+                     meta_features_all,
+                     user_ids:  Optional[Iterable[int]] = None,
+                     k:         int = 10,
+                     max_users: int = 200,
+                     seed:      int = 42) -> Dict[str, float]:
+    """
+    Recall@k of the retrieval stage against full-catalog DeepFM scoring:
+    the fraction of the exhaustive top-k that survives into the candidate set.
+    """
+    if user_ids is None:
+        users = df["u_idx"].unique()
+        rng = np.random.default_rng(seed)
+        if len(users) > max_users:
+            users = rng.choice(users, max_users, replace=False)
+    else:
+        users = np.asarray(list(user_ids))
+
+    all_items = np.sort(df["i_idx"].unique())
+    meta_lookup = build_meta_lookup(df, meta_features_all)
+    seq_by_user = df.groupby("u_idx")["seq"].first().to_dict()
+    seen_by_user = df.groupby("u_idx")["i_idx"].agg(set).to_dict()
+
+    recalls, sizes = [], []
+    for u in users:
+        u = int(u)
+        seen = seen_by_user.get(u, set())
+        unseen = [int(i) for i in all_items if i not in seen]
+        if not unseen:
+            continue
+        user_seq = seq_by_user.get(u)
+        if user_seq is None:
+            user_seq = [retriever.pad_token] * len(df["seq"].iloc[0])
+        full = score_items(model, u, user_seq, unseen, meta_lookup,
+                           meta_features_all.shape[1])
+        top_full = set(np.asarray(unseen)[np.argsort(-full)[:k]].tolist())
+
+        cands = set(retriever.retrieve(u, user_seq, seen))
+        recalls.append(len(top_full & cands) / len(top_full))
+        sizes.append(len(cands))
+
+    return {
+        "users":          len(recalls),
+        "k":              k,
+        "recall_at_k":    float(np.mean(recalls)) if recalls else 0.0,
+        "mean_candidates": float(np.mean(sizes)) if sizes else 0.0,
+        "catalog_size":   int(len(all_items)),
+    }
+
+
+if __name__ == "__main__":
+    from backend.embedding_bench import _dims
+    from backend.feature_store import FeatureStore
+    from backend.model import HybridDeepFM
+    from backend.training import META_COLS
+
+    ap = argparse.ArgumentParser(description="Recall of the retrieval stage vs. full scoring.")
+    ap.add_argument("--ckpt", type=Path, default=Path(__file__).parent / "new_dien.pth")
+    ap.add_argument("--data", type=Path, default=Path("preprocessed_data.csv"))
+    ap.add_argument("--emb-dir", type=Path, default=Path("."))
+    ap.add_argument("--embedding", type=int, default=200)
+    ap.add_argument("--neighbour", type=int, default=100)
+    ap.add_argument("--popular", type=int, default=50)
+    ap.add_argument("--k", type=int, default=10)
+    ap.add_argument("--users", type=int, default=200)
+    ap.add_argument("--out", type=Path)
+    args = ap.parse_args()
+
+    ckpt = torch.load(args.ckpt, map_location="cpu")
+    df = pd.read_csv(args.data)
+    df["seq"] = df["seq"].apply(ast.literal_eval)
+    emb = {k: np.load(args.emb_dir / f"{k}_embeddings.npy")
+           for k in ("review", "features", "product_title")
+           if (args.emb_dir / f"{k}_embeddings.npy").exists()}
+    store = FeatureStore.from_frame(df, emb, [c for c in META_COLS if c in df.columns])
+    if store.meta_dim != _dims(ckpt)["meta_dim"]:
+        raise SystemExit(f"meta dim {store.meta_dim} != checkpoint {_dims(ckpt)['meta_dim']}")
+
+    model = HybridDeepFM(**_dims(ckpt))
+    model.load_state_dict(ckpt, strict=False)
+    model.eval()
+    retriever = CandidateRetriever(model, df, args.embedding, args.neighbour, args.popular)
+    res = retrieval_recall(model, retriever, df, store, k=args.k, max_users=args.users)
+    print(f"[retrieval] recall@{res['k']} {res['recall_at_k']:.3f}  "
+          f"{res['mean_candidates']:.0f} / {res['catalog_size']} items over {res['users']} users")
+    if args.out:
+        args.out.write_text(json.dumps(res, indent=2))
@@ -0,0 +1,169 @@
+# backend/text_embedding.py
+"""
+Batched text-embedding stage used by `Preprocessing`.
+
+Compared with a plain `EMBEDDER.encode(sentences)` per column it:
+• sorts inputs by token length so each batch pads to a similar length
+• uses a tuned batch size per field
+• optionally fans out over a multi-process CPU pool
+• optionally swaps in a smaller / int8-quantised local model per field
+• writes straight into one preallocated float16/float32 array
+and records sentences/sec for every field.
+
+The service builds one pipeline at import time (`core_models.EMBED_PIPELINE`)
+from the environment, so pools and quantised copies are created once:
+
+    RECOAI_EMBED_MODELS    per-field encoders, e.g. "review=all-MiniLM-L6-v2"
+    RECOAI_EMBED_BATCH     per-field batch sizes, e.g. "review=32,features=16"
+    RECOAI_EMBED_WORKERS / RECOAI_EMBED_QUANTIZE / RECOAI_EMBED_DTYPE
+
+NB: a per-field model with a different output width changes the meta
+dimension, so it needs a checkpoint trained with the same encoder.
+"""
+
+from __future__ import annotations
+import copy, os, threading, time
+from typing import Callable, Dict, List, Optional, Union
+
+import numpy as np
+import torch
+from sentence_transformers import SentenceTransformer
+
+ModelSpec = Union[str, SentenceTransformer]
+
+DEFAULT_BATCH = {"review": 64, "product_title": 128, "features": 32}
+
+
+def parse_field_map(spec: str) -> Dict[str, str]:
+    """"a=x,b=y" → {"a": "x", "b": "y"} (blank → {})."""
+    out = {}
+    for item in filter(None, (p.strip() for p in spec.split(","))):
+        field, sep, value = item.partition("=")
+        if not sep or not field.strip() or not value.strip():
+            raise ValueError(f"expected field=value, got {item!r}")
+        out[field.strip()] = value.strip()
+    return out
+
+
+class EmbeddingPipeline:
+    """
+    Args:
+        default_model – encoder for fields without an override
+        field_models  – {field: model name / path / instance}
+        batch_sizes   – {field: batch size}; falls back to DEFAULT_BATCH
+        n_workers     – >1 starts a CPU process pool per model
+        quantize      – dynamic int8 quantisation of Linear layers (CPU)
+        dtype         – "float32" or "float16" output storage
+    """
+    def __init__(self,
+                 default_model: SentenceTransformer,
+                 field_models:  Optional[Dict[str, ModelSpec]] = None,
+                 batch_sizes:   Optional[Dict[str, int]] = None,
+                 n_workers:     int = 0,
+                 quantize:      bool = False,
+                 dtype:         str = "float32"):
+        self.default_model = default_model
+        self.field_models  = dict(field_models or {})
+        self.batch_sizes   = {**DEFAULT_BATCH, **(batch_sizes or {})}
+        self.n_workers     = n_workers
+        self.quantize      = quantize
+        self.dtype         = np.dtype(dtype)
+
+        self._models: Dict[str, SentenceTransformer] = {}
+        self._pools:  Dict[int, dict] = {}
+        self.stats:   Dict[str, dict] = {}
+        # one shared instance serves concurrent jobs; pools are not re-entrant
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, default_model: SentenceTransformer) -> "EmbeddingPipeline":
+        """Pipeline configured from the RECOAI_EMBED_* variables."""
+        batch = parse_field_map(os.getenv("RECOAI_EMBED_BATCH", ""))
+        return cls(default_model,
+                   field_models=parse_field_map(os.getenv("RECOAI_EMBED_MODELS", "")),
+                   batch_sizes={k: int(v) for k, v in batch.items()},
+                   n_workers=int(os.getenv("RECOAI_EMBED_WORKERS", 0)),
+                   quantize=os.getenv("RECOAI_EMBED_QUANTIZE", "0") == "1",
+                   dtype=os.getenv("RECOAI_EMBED_DTYPE", "float32"))
+
+    # --------------------------------------------------------------------- #
+    def _model(self, field: str) -> SentenceTransformer:
+        spec = self.field_models.get(field, self.default_model)
+        key = spec if isinstance(spec, str) else f"id:{id(spec)}"
+        if key not in self._models:
+            model = spec
+            if isinstance(spec, str):
+                model = SentenceTransformer(spec, device="cpu" if self.quantize else None)
+            if self.quantize:
+                if model is self.default_model:          # never mutate the shared encoder
+                    model = copy.deepcopy(model)
+                model = torch.quantization.quantize_dynamic(
+                    model.cpu(), {torch.nn.Linear}, dtype=torch.qint8)
+            self._models[key] = model
+        return self._models[key]
+
+    def _token_lengths(self, model: SentenceTransformer, sentences: List[str]) -> np.ndarray:
+        tok = model.tokenizer(sentences, add_special_tokens=False, truncation=True,
+                              max_length=model.max_seq_length)
+        return np.fromiter((len(ids) for ids in tok["input_ids"]),
+                           dtype=np.int64, count=len(sentences))
+
+    def _pool(self, model: SentenceTransformer):
+        if id(model) not in self._pools:
+            self._pools[id(model)] = model.start_multi_process_pool(["cpu"] * self.n_workers)
+        return self._pools[id(model)]
+
+    def close(self) -> None:
+        """Stop any worker pools (models stay cached)."""
+        with self._lock:
+            for pool in self._pools.values():
+                SentenceTransformer.stop_multi_process_pool(pool)
+            self._pools.clear()
+
+    def __enter__(self): return self
+    def __exit__(self, *exc): self.close()
+
+    # --------------------------------------------------------------------- #
+    def encode(self, field: str, sentences: List[str],
+               progress: Optional[Callable[[float], None]] = None,
+               stats: Optional[Dict[str, dict]] = None) -> np.ndarray:
+        """
+        Embeddings for `sentences` in their original order.
+        `progress(fraction)` is called after each batch; this run's timing
+        is also written to `stats[field]` when given (per-caller record).
+        Calls are serialised, so one pipeline can be shared by all jobs.
+        """
+        with self._lock:
+            return self._encode(field, sentences, progress, stats)
+
+    def _encode(self, field, sentences, progress, stats) -> np.ndarray:
+        model = self._model(field)
+        bs    = self.batch_sizes.get(field, 64)
+        n     = len(sentences)
+        out   = np.empty((n, model.get_sentence_embedding_dimension()), dtype=self.dtype)
+        if n == 0:
+            return out
+
+        t0 = time.perf_counter()
+        order = np.argsort(-self._token_lengths(model, sentences), kind="stable")
+        ordered = [sentences[i] for i in order]
+
+        if self.n_workers > 1:
+            emb = model.encode_multi_process(ordered, self._pool(model), batch_size=bs)
+            out[order] = emb
+        else:
+            for start in range(0, n, bs):
+                idx = order[start:start + bs]
+                out[idx] = model.encode(ordered[start:start + bs], batch_size=bs,
+                                        show_progress_bar=False, convert_to_numpy=True)
+                if progress:
+                    progress(min(start + bs, n) / n)
+        if progress:
+            progress(1.0)
+
+        dt = time.perf_counter() - t0
+        self.stats[field] = {"sentences": n, "seconds": dt, "sentences_per_sec": n / dt}
+        if stats is not None:
+            stats[field] = self.stats[field]
+        print(f"[embed] {field}: {n} sentences in {dt:.1f}s ({n/dt:,.0f}/s)")
+        return out
@@ -4,81 +4,57 @@ from scipy.sparse import csr_matrix
 import numpy as np
 import torch
 
-def hybrid_topk_recommendation(
-    model,
-    user_id,
-    df,
-    meta_features_all,
-    product_title_map,
-    item_embeddings,
-    deepfm_weight=0.7,
-    knn_weight=0.3,
-    like_threshold=4,
-    top_n_users=10,
-    top_k_items=5
-):
+def build_meta_lookup(df, meta_features_all):
+    # a FeatureStore already is an item-indexed lookup
+    if hasattr(meta_features_all, 'item_meta'):
+        return meta_features_all
+    return {i: meta for i, meta in zip(df['i_idx'], meta_features_all)}
+
+def build_item_maps(df):
+    """i_idx → product_id / title, built once per dataset (not per request)."""
+    by_item = df.groupby('i_idx')
+    return {'asin':  by_item['product_id'].last().to_dict(),
+            'title': by_item['product_title'].last().to_dict()}
+
+def score_items(model, user_id, user_seq, items, meta_lookup, meta_dim, state=None):
+    """
+    Sigmoid DeepFM scores for `items` given one user's history.
+    The history is encoded once (or taken from a cached `UserState`) and
+    broadcast to all candidates instead of re-running the GRU per item.
+    """
     device = next(model.parameters()).device
-    pad_token = df['i_idx'].max() + 1
-
-    # Precompute lookups
-    meta_lookup = {i: meta for i, meta in zip(df['i_idx'], meta_features_all)}
-    i2asin = df.set_index('i_idx')['product_id'].to_dict()
-    i2title = df.set_index('i_idx')['product_title'].to_dict()
-
-    # Step 1: unseen items
-    user_df = df[df['u_idx'] == user_id]
-    seen_items = set(user_df['i_idx'])
-    all_items = set(df['i_idx'].unique())
-    unseen_items = list(all_items - seen_items)
-    if not unseen_items:
-        return []
-
-    # Step 2: DeepFM scoring
-    model.eval()
-    seq_template = df['seq'].iloc[0]
-    if user_df.empty:
-        user_seq = [pad_token] * len(seq_template)
-    else:
-        user_seq = user_df['seq'].iloc[0]
-
-    N = len(unseen_items)
-    seq_tensor = torch.tensor([user_seq], dtype=torch.long).repeat(N, 1).to(device)
+    N = len(items)
     uidx_tensor = torch.tensor([user_id] * N, dtype=torch.long).to(device)
-    iidx_tensor = torch.tensor(unseen_items, dtype=torch.long).to(device)
+    iidx_tensor = torch.tensor(items, dtype=torch.long).to(device)
 
-    meta_rows = np.vstack([
-        meta_lookup.get(i, np.zeros(meta_features_all.shape[1], dtype=float))
-        for i in unseen_items
-    ])
+    if hasattr(meta_lookup, 'item_meta'):
+        meta_rows = meta_lookup.item_meta(items)
+    else:
+        meta_rows = np.vstack([
+            meta_lookup.get(i, np.zeros(meta_dim, dtype=float))
+            for i in items
+        ])
     meta_tensor = torch.tensor(meta_rows, dtype=torch.float32).to(device)
 
+    model.eval()
     with torch.no_grad():
+        if state is None:
+            seq_tensor = torch.tensor([user_seq], dtype=torch.long, device=device)
+            seq_emb, gru_out, _ = model.cf.encode_history(seq_tensor)
+            T, D = gru_out.shape[1:]
+            seq_emb, gru_out = seq_emb.expand(N, T, D), gru_out.expand(N, T, D)
+        else:
+            seq_emb, gru_out = state.history(N, model.cf.item_emb)
         preds, _ = model({
             'u_idx': uidx_tensor,
             'i_idx': iidx_tensor,
-            'seq': seq_tensor,
+            'seq_emb': seq_emb,
+            'gru_out': gru_out,
             'meta': meta_tensor
         })
-        deepfm_scores = torch.sigmoid(preds).cpu().numpy().flatten()
-
-    # Cold-start: use constant final score if no history
-    if user_df.empty:
-        recs = []
-        for idx, item_id in enumerate(unseen_items):
-            asin = i2asin.get(item_id, "Unknown")
-            title = i2title.get(item_id, "Unknown Title")
-            recs.append({
-                'item_id': item_id,
-                'asin': asin,
-                'title': title,
-                'deepfm_score': round(deepfm_scores[idx], 4),
-                'knn_score': 0.0,
-                'final_score': 0.1,
-                'top5_related_past_titles': []
-            })
-        return sorted(recs, key=lambda x: x['final_score'], reverse=True)[:top_k_items]
+    return torch.sigmoid(preds).cpu().numpy().flatten()
 
-    # Step 3: CF-KNN for similar users
+def _cf_item_scores(df, user_id, like_threshold, top_n_users):
     df_like = df[df['rating'] >= like_threshold]
     uim = df_like.pivot_table(index='u_idx', columns='i_idx', values='rating', fill_value=0)
     sparse_mat = csr_matrix(uim.values)
@@ -96,6 +72,67 @@ def hybrid_topk_recommendation(
         item_scores = neigh_df['i_idx'].value_counts(normalize=True).to_dict()
     else:
         item_scores = {}
+    return item_scores
+
+def hybrid_topk_recommendation(
+    model,
+    user_id,
+    df,
+    meta_features_all,
+    product_title_map,
+    item_embeddings,
+    deepfm_weight=0.7,
+    knn_weight=0.3,
+    like_threshold=4,
+    top_n_users=10,
+    top_k_items=5,
+    retriever=None,
+    state_cache=None,
+    item_maps=None
+):
+    pad_token = df['i_idx'].max() + 1
+
+    # Precompute lookups
+    meta_lookup = build_meta_lookup(df, meta_features_all)
+    item_maps = item_maps or build_item_maps(df)
+    i2asin, i2title = item_maps['asin'], item_maps['title']
+
+    # Step 1: unseen items
+    user_df = df[df['u_idx'] == user_id]
+    seen_items = set(user_df['i_idx'])
+    if user_df.empty:           # new users: serve `ColdStartTable.top_k` instead
+        return []
+    user_seq = user_df['seq'].iloc[0]
+
+    # Cached interest state (includes any session clicks appended to it)
+    state = None
+    if state_cache is not None:
+        state = state_cache.get(user_id, user_seq)
+        user_seq = state.seq
+        seen_items |= set(user_seq) - {pad_token}
+
+    # Step 1b: candidate retrieval (optional) – rank only a few hundred items
+    item_scores = None
+    if retriever is not None:
+        # the retriever's neighbour index is only valid for its own threshold
+        if retriever.like_threshold == like_threshold:
+            item_scores = retriever.neighbour_item_scores(user_id, top_n_users)
+        else:
+            item_scores = _cf_item_scores(df, user_id, like_threshold, top_n_users)
+        unseen_items = retriever.retrieve(user_id, user_seq, seen_items, item_scores)
+    else:
+        all_items = set(df['i_idx'].unique())
+        unseen_items = list(all_items - seen_items)
+    if not unseen_items:
+        return []
+
+    # Step 2: DeepFM scoring
+    deepfm_scores = score_items(model, user_id, user_seq, unseen_items,
+                                meta_lookup, meta_features_all.shape[1], state)
+
+    # Step 3: CF-KNN for similar users
+    if item_scores is None:                    # retriever already computed it
+        item_scores = _cf_item_scores(df, user_id, like_threshold, top_n_users)
 
     # Step 4: KNN for past-item similarity
     past_item_ids = user_seq
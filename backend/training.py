@@ -0,0 +1,175 @@
+# backend/training.py
+"""
+Dataset and fine-tune loop shared by the API (`backend.main`) and the
+multi-process trainer (`backend.distributed`).
+
+Kept free of FastAPI / `core_models` imports so spawned worker processes
+can unpickle datasets without loading the text encoder or checkpoint.
+"""
+
+from __future__ import annotations
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+import torch
+from torch.utils.data import (BatchSampler, DataLoader, Dataset,
+                              SequentialSampler, WeightedRandomSampler)
+from sklearn.metrics import roc_auc_score
+
+
+# ─────────────────────────── Meta features ─────────────────────────
+META_COLS = ["price_scaled", "sentiment",
+             "category_encoded", "color_encoded", "material_encoded"]
+
+EMB_DIM = 64      # keep in sync with your text encoder
+
+def build_meta_matrix(df: pd.DataFrame,
+                      emb: Dict[str, np.ndarray],
+                      struct_cols: List[str]) -> np.ndarray:
+    """
+    Stack [structured | review_emb | feature_emb | title_emb]
+    • Missing structured cols → zeros
+    • Missing embedding keys → zeros
+    """
+    parts: List[np.ndarray] = []
+
+    # structured features
+    for col in struct_cols:
+        if col in df.columns:
+            parts.append(df[[col]].values.astype("float32"))
+        else:
+            print(f"⚠️ '{col}' missing → zeros")
+            parts.append(np.zeros((len(df), 1), dtype="float32"))
+
+    # text / dense embeddings
+    for name in ("review", "features", "product_title"):
+        if name in emb:
+            parts.append(emb[name].astype("float32"))
+        else:
+            print(f"⚠️ '{name}' embedding missing → zeros")
+            parts.append(np.zeros((len(df), EMB_DIM), dtype="float32"))
+
+    return np.hstack(parts)
+
+# ─────────────────────────── Datasets ──────────────────────────────
+class RecommenderDataset(Dataset):
+    """
+    `meta` is either a dense [len(df), meta_dim] matrix or a
+    `FeatureStore`; with a store, `rows` are the df positions of these
+    interactions and meta is gathered per batch.
+
+    Indexing accepts a single index or a list of indices (whole batch –
+    see `batched_loader`).
+    """
+    def __init__(self, df, meta, labels, rows=None):
+        self.u_idx = torch.tensor(df["u_idx"].values, dtype=torch.long)
+        self.i_idx = torch.tensor(df["i_idx"].values, dtype=torch.long)
+        self.seq   = torch.tensor(np.vstack(df["seq"].values), dtype=torch.long)
+        self.y     = torch.tensor(labels, dtype=torch.float32)
+        if hasattr(meta, "gather"):
+            self.store = meta
+            self.rows  = np.arange(len(df)) if rows is None else np.asarray(rows)
+            self.items = df["i_idx"].to_numpy()
+            self.meta  = None
+        else:
+            self.store = None
+            self.meta  = torch.tensor(meta, dtype=torch.float32)
+
+    def __len__(self): return len(self.y)
+    def __getitem__(self, i):
+        if self.store is None:
+            meta = self.meta[i]
+        else:
+            meta = torch.from_numpy(self.store.gather(self.rows[i], self.items[i]))
+            if np.ndim(i) == 0: meta = meta[0]
+        return {"u_idx": self.u_idx[i], "i_idx": self.i_idx[i],
+                "seq": self.seq[i],     "meta":  meta}, self.y[i]
+
+
+def class_balance_weights(labels: np.ndarray) -> np.ndarray:
+    """Per-sample weights so each class is drawn equally often."""
+    labels = np.asarray(labels, dtype=np.int64)
+    return (1.0 / np.bincount(labels))[labels]
+
+
+def batched_loader(ds: Dataset, batch_size: int, sampler=None) -> DataLoader:
+    """Loader that fetches each batch with one list index (one gather)."""
+    sampler = sampler if sampler is not None else SequentialSampler(ds)
+    return DataLoader(ds, batch_size=None,
+                      sampler=BatchSampler(sampler, batch_size, drop_last=False))
+
+
+def balanced_loader(ds: Dataset, labels: np.ndarray, batch_size: int) -> DataLoader:
+    weights = class_balance_weights(labels)
+    sampler = WeightedRandomSampler(weights, len(weights), replacement=True)
+    return batched_loader(ds, batch_size, sampler)
+
+# ─────────────────────────── Loop pieces ───────────────────────────
+
+def train_epoch(model, loader, opt, crit, device, aux_weight: float) -> Tuple[float, int]:
+    """One pass over `loader`. Returns (mean loss, samples seen)."""
+    model.train(); running, seen = 0.0, 0
+    for bx, yb in loader:
+        bx = {k: v.to(device) for k, v in bx.items()}
+        yb = yb.to(device)
+        opt.zero_grad()
+        logits, aux = model(bx)
+        loss = crit(logits, yb) + aux_weight * crit(aux, yb)
+        loss.backward(); opt.step(); running += loss.item()
+        seen += len(yb)
+    return running / max(len(loader), 1), seen
+
+
+def predict(model, loader, device) -> Tuple[np.ndarray, np.ndarray]:
+    """Labels and sigmoid scores for every row of `loader`."""
+    model.eval(); ys, ps = [], []
+    with torch.no_grad():
+        for bx, yb in loader:
+            bx = {k: v.to(device) for k, v in bx.items()}
+            preds, _ = model(bx)
+            ys.append(yb)
+            ps.append(torch.sigmoid(preds).cpu())
+    if not ys:
+        return np.empty(0, dtype=np.float32), np.empty(0, dtype=np.float32)
+    return torch.cat(ys).numpy(), torch.cat(ps).numpy()
+
+
+def trainable_state(model, frozen_prefixes=("cf.",)) -> Dict[str, torch.Tensor]:
+    """Detached copy of the parameters that fine-tuning actually changes."""
+    return {k: v.detach().clone() for k, v in model.state_dict().items()
+            if not k.startswith(frozen_prefixes)}
+
+
+def run_fine_tune(model,
+                  tr_ds:      RecommenderDataset,
+                  vl_ds:      RecommenderDataset,
+                  train_labels: np.ndarray,
+                  epochs:     int,
+                  lr:         float,
+                  batch_size: int,
+                  aux_weight: float,
+                  device,
+                  log: Callable[[str], None] = print) -> Tuple[Optional[dict], float]:
+    """Single-process fine-tune. Returns (best trainable state, best AUC)."""
+    tl = balanced_loader(tr_ds, train_labels, batch_size)
+    vl = batched_loader(vl_ds, batch_size)
+
+    model.to(device)
+    opt  = torch.optim.Adam(filter(lambda p: p.requires_grad, model.parameters()), lr=lr)
+    crit = torch.nn.BCEWithLogitsLoss()
+
+    best_auc, best_state = 0.0, None
+    for ep in range(epochs):
+        t0 = time.perf_counter()
+        loss, seen = train_epoch(model, tl, opt, crit, device, aux_weight)
+        dt = time.perf_counter() - t0
+
+        yt, yp = predict(model, vl, device)
+        auc = roc_auc_score(yt, yp)
+        log(f"ep {ep+1}/{epochs} loss {loss:.4f}  auc {auc:.4f}  "
+            f"{seen/dt:,.0f} samples/s")
+        if auc > best_auc:
+            best_auc, best_state = auc, trainable_state(model)
+    return best_state, best_auc
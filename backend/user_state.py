@@ -0,0 +1,211 @@
+# backend/user_state.py
+"""
+Per-user interest-state cache for `DIENCollaborative`.
+
+The GRU over a user's history does not depend on the candidate item, so
+its output can be computed once and reused for every candidate and every
+repeat request.  When a session appends a click, the cached state is
+advanced by a single GRU step instead of re-encoding the whole window.
+
+Only the AUGRU (which *is* target-dependent) still runs per candidate.
+
+Incremental steps continue the GRU from its last hidden state while the
+fixed window drops its oldest item, so they drift slightly from a fresh
+encode of the new window; `exact_every` bounds that by re-encoding after
+that many appends.
+
+Memory is bounded in bytes, not entries: every cache charges a
+`MemoryBudget`, normally one shared by all caches in the process, and
+evicts its own least-recently-used users while the budget is exceeded.
+"""
+
+from __future__ import annotations
+import threading, weakref
+from collections import OrderedDict
+from typing import Iterable, Optional, Sequence, Tuple
+
+import torch
+
+
+class UserState:
+    """Immutable once cached: `append` builds a new state and swaps it in."""
+    __slots__ = ("base", "seq", "gru_out", "h", "steps")
+
+    def __init__(self, base, seq, gru_out, h, steps: int = 0):
+        self.base    = base      # history the state was built from (tuple)
+        self.seq     = seq       # current window incl. session appends (list)
+        self.gru_out = gru_out   # [T, D]
+        self.h       = h         # [D]  last GRU hidden state
+        self.steps   = steps     # incremental appends since last exact encode
+
+    @property
+    def nbytes(self) -> int:
+        return (self.gru_out.nelement() * self.gru_out.element_size()
+                + self.h.nelement() * self.h.element_size() + 8 * len(self.seq))
+
+    @torch.no_grad()
+    def history(self, n: int, item_emb: torch.nn.Module) -> Tuple[torch.Tensor, torch.Tensor]:
+        """
+        (seq_emb, gru_out) broadcast to `n` candidates without copying.
+        `seq_emb` is a table lookup, so it is recomputed rather than cached.
+        """
+        T, D = self.gru_out.shape
+        seq_emb = item_emb(torch.tensor(self.seq, dtype=torch.long,
+                                        device=self.gru_out.device))
+        return (seq_emb.unsqueeze(0).expand(n, T, D),
+                self.gru_out.unsqueeze(0).expand(n, T, D))
+
+
+class MemoryBudget:
+    """Byte counter shared by the caches that charge it."""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.used      = 0
+        self._lock     = threading.Lock()
+
+    def charge(self, nbytes: int) -> None:
+        with self._lock:
+            self.used += nbytes
+
+    @property
+    def exceeded(self) -> bool:
+        return self.used > self.max_bytes
+
+
+class UserStateCache:
+    """
+    Thread-safe LRU of `UserState`, bound to one model. A different model,
+    or a bump of its explicit `version` (any `load_state_dict` on it),
+    invalidates every entry.  Parameter `_version` counters are not used:
+    the CF tower is shared by all tenant models, so another tenant's
+    weight load would otherwise wipe this cache.
+
+    Without a shared `budget` the cache gets a private one of `max_bytes`.
+    """
+    def __init__(self, model, max_bytes: int = 256 << 20, exact_every: int = 20,
+                 budget: Optional[MemoryBudget] = None):
+        self.budget      = budget or MemoryBudget(max_bytes)
+        self.exact_every = exact_every
+        self._lock  = threading.Lock()
+        self._store: "OrderedDict[int, UserState]" = OrderedDict()
+        self._bytes = [0]                    # mutable: read by the finalizer
+        self.hits = self.misses = self.increments = self.evictions = 0
+        # a dropped cache (workspace spill / new dataset) returns its bytes
+        weakref.finalize(self, _release, self.budget, self._bytes)
+        self._bind(model)
+
+    # --------------------------------------------------------------------- #
+    @staticmethod
+    def _fingerprint(model) -> tuple:
+        return (id(model), getattr(model, "version", None))
+
+    def _bind(self, model) -> None:
+        self.model = model
+        self._fp   = self._fingerprint(model)
+        self._clear()
+
+    def _clear(self) -> None:
+        self._store.clear()
+        self.budget.charge(-self._bytes[0]); self._bytes[0] = 0
+
+    def ensure_model(self, model) -> None:
+        """Drop all states if the model (or its version) changed."""
+        with self._lock:
+            self._check(model)
+
+    def _check(self, model) -> None:
+        if model is not self.model or self._fingerprint(model) != self._fp:
+            self._bind(model)
+
+    def invalidate(self, user_id: Optional[int] = None) -> None:
+        with self._lock:
+            if user_id is None: self._clear()
+            else:               self._drop(user_id)
+
+    def __len__(self): return len(self._store)
+
+    @property
+    def nbytes(self) -> int:
+        return self._bytes[0]
+
+    def stats(self) -> dict:
+        return {"size": len(self._store), "bytes": self._bytes[0],
+                "budget_used": self.budget.used, "budget_max": self.budget.max_bytes,
+                "hits": self.hits, "misses": self.misses,
+                "increments": self.increments, "evictions": self.evictions}
+
+    # --------------------------------------------------------------------- #
+    @torch.no_grad()
+    def _encode(self, seq: Sequence[int]) -> UserState:
+        cf = self.model.cf
+        device = next(self.model.parameters()).device
+        t = torch.tensor([list(seq)], dtype=torch.long, device=device)
+        _, gru_out, h_n = cf.encode_history(t)
+        return UserState(None, list(seq), gru_out[0], h_n[0, 0])
+
+    @torch.no_grad()
+    def _step(self, st: UserState, item_id: int) -> UserState:
+        """`st` advanced by one GRU step, as a new state (`st` is untouched)."""
+        cf = self.model.cf
+        x = cf.item_emb(torch.tensor([[item_id]], dtype=torch.long,
+                                     device=st.h.device))          # [1,1,D]
+        out, h_n = cf.gru(x, st.h.view(1, 1, -1))
+        return UserState(st.base, st.seq[1:] + [item_id],
+                         torch.cat([st.gru_out[1:], out[0]], dim=0),
+                         h_n[0, 0], st.steps + 1)
+
+    def _drop(self, user_id: int) -> None:
+        st = self._store.pop(user_id, None)
+        if st is not None:
+            self._bytes[0] -= st.nbytes; self.budget.charge(-st.nbytes)
+
+    def _put(self, user_id: int, st: UserState) -> None:
+        self._drop(user_id)
+        self._store[user_id] = st
+        self._bytes[0] += st.nbytes; self.budget.charge(st.nbytes)
+        # evict own LRU users (never the one just stored) while over budget
+        while self.budget.exceeded and len(self._store) > 1:
+            self._drop(next(iter(self._store))); self.evictions += 1
+
+    def _lookup(self, user_id: int, base: tuple) -> UserState:
+        """Caller holds the lock."""
+        self._check(self.model)
+        st = self._store.get(user_id)
+        if st is not None and st.base == base:
+            self.hits += 1
+            self._store.move_to_end(user_id)
+            return st
+        self.misses += 1
+        st = self._encode(base); st.base = base
+        self._put(user_id, st)
+        return st
+
+    # --------------------------------------------------------------------- #
+    def get(self, user_id: int, base_seq: Sequence[int]) -> UserState:
+        """
+        State for `user_id` whose stored history is `base_seq`. Session
+        appends made via `append` are kept as long as `base_seq` is unchanged.
+        The returned state never changes, so it is safe to use unlocked.
+        """
+        base = tuple(int(i) for i in base_seq)
+        with self._lock:
+            return self._lookup(user_id, base)
+
+    def append(self, user_id: int, base_seq: Sequence[int],
+               items: Iterable[int]) -> UserState:
+        """Advance the user's state by one GRU step per new item (copy-on-write)."""
+        base = tuple(int(i) for i in base_seq)
+        with self._lock:
+            st = self._lookup(user_id, base)
+            for item in items:
+                st = self._step(st, int(item)); self.increments += 1
+            if st.steps >= self.exact_every:
+                fresh = self._encode(st.seq); fresh.base = st.base
+                st = fresh
+            self._put(user_id, st)
+            return st
+
+
+def _release(budget: MemoryBudget, held: list) -> None:
+    budget.charge(-held[0]); held[0] = 0
@@ -0,0 +1,250 @@
+# backend/workspace.py
+"""
+Per-tenant workspaces for the API.
+
+Each `/upload` gets its own `Workspace` holding the raw / processed frames,
+meta features and fine-tuned heads for that tenant.  Workspaces that sit
+idle longer than `idle_seconds` are spilled to disk and transparently
+reloaded on next access, so one process can serve many tenants without
+keeping every dataset resident.
+
+Model weights are *not* stored here beyond the small per-tenant layers; the
+shared, frozen towers stay loaded once in `backend.core_models`.
+"""
+
+from __future__ import annotations
+
+import shutil, tempfile, threading, time, uuid
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional
+
+import numpy as np
+import pandas as pd
+import torch
+
+from backend.feature_store import FeatureStore
+
+
+class Workspace:
+    """In-memory state of one tenant (may be spilled to `path`)."""
+
+    # attributes moved to disk on spill
+    _FRAMES = ("raw_df", "df_processed")
+
+    def __init__(self, ws_id: str, path: Path):
+        self.id        = ws_id
+        self.path      = path
+        self.last_used = time.monotonic()
+        self.pins      = 0          # >0 while a request / job is using it
+        self.spilled   = False
+        self.io_lock   = threading.Lock()   # serialises spill / reload of this one
+
+        self.raw_df:       Optional[pd.DataFrame]        = None
+        self.df_processed: Optional[pd.DataFrame]        = None
+        # meta features replace the per-row text embeddings after /preprocess
+        self.features:     Optional[FeatureStore]        = None
+        self.item_embs:    Optional[np.ndarray]          = None   # title row per item
+        self.ft_models:    Dict[str, torch.nn.Module]    = {}
+        self.generation = 0         # bumped whenever the dataset is replaced
+
+        # derived, rebuilt on demand (never spilled)
+        self.cache: Dict[str, Any] = {}
+
+    def touch(self) -> None:
+        self.last_used = time.monotonic()
+
+    def clear_models(self) -> None:
+        """
+        Forget fine-tuned heads (and their spill files) because the data
+        they were trained on is being replaced; fine-tunes still running
+        on the old data see `generation` change and discard their result.
+        """
+        with self.io_lock:                   # not while a spill is writing them
+            for job_id in self.ft_models:
+                (self.path / f"ft_{job_id}.pth").unlink(missing_ok=True)
+            self.ft_models  = {}
+            self.generation += 1
+
+    def nbytes(self) -> int:
+        """Rough resident size of the tenant's data (frames + features)."""
+        total = 0
+        for name in self._FRAMES:
+            df = getattr(self, name)
+            if df is not None:
+                total += int(df.memory_usage(deep=True).sum())
+        if self.features is not None:
+            total += self.features.nbytes
+        if self.item_embs is not None:
+            total += self.item_embs.nbytes
+        return total
+
+
+class WorkspaceStore:
+    """
+    Thread-safe registry of workspaces with idle spill-to-disk.
+
+    The store lock only guards the registry and pin / spill flags; disk
+    I/O for spilling and reloading happens outside it (under the
+    workspace's own `io_lock`), so a sweep never blocks other tenants.
+
+    `model_factory` rebuilds an empty tenant model when a spilled
+    fine-tuned head is reloaded; only parameters outside `shared_prefixes`
+    are written to disk.
+    """
+
+    def __init__(self,
+                 model_factory:   Callable[[], torch.nn.Module],
+                 root:            Optional[Path] = None,
+                 idle_seconds:    float = 600.0,
+                 shared_prefixes: tuple = ("cf.",)):
+        self.root = Path(root or tempfile.mkdtemp(prefix="recoai_ws_"))
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.idle_seconds    = idle_seconds
+        self.model_factory   = model_factory
+        self.shared_prefixes = shared_prefixes
+        self._ws: Dict[str, Workspace] = {}
+        self._lock = threading.RLock()
+
+    # --------------------------------------------------------------------- #
+    def create(self) -> Workspace:
+        ws_id = uuid.uuid4().hex
+        ws = Workspace(ws_id, self.root / ws_id)
+        with self._lock:
+            self._ws[ws_id] = ws
+        return ws
+
+    def get(self, ws_id: str) -> Workspace:
+        """
+        Return the workspace, reloading it from disk if spilled.
+        May block on I/O – call from a worker thread, not the event loop.
+        """
+        with self._lock:
+            ws = self._ws.get(ws_id)
+            if ws is None:
+                raise KeyError(ws_id)
+            if not ws.spilled:
+                ws.touch()
+                return ws
+        with ws.io_lock:
+            if ws.spilled:                   # another thread may have won
+                self._load(ws)
+        with self._lock:
+            ws.touch()
+        return ws
+
+    @contextmanager
+    def use(self, ws_id: str):
+        """Pin a workspace so it is not spilled while in use."""
+        while True:
+            ws = self.get(ws_id)
+            with self._lock:
+                if not ws.spilled:           # not re-spilled since `get`
+                    ws.pins += 1
+                    break
+        try:
+            yield ws
+        finally:
+            with self._lock:
+                ws.pins -= 1
+                ws.touch()
+
+    def delete(self, ws_id: str) -> None:
+        with self._lock:
+            ws = self._ws.pop(ws_id, None)
+        if ws is not None:
+            with ws.io_lock:                 # not while a spill is writing
+                shutil.rmtree(ws.path, ignore_errors=True)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total    = len(self._ws)
+            resident = [w for w in self._ws.values() if not w.spilled]
+        return {                             # sizing frames is slow: no lock
+            "workspaces": total,
+            "resident":   len(resident),
+            "resident_bytes": sum(w.nbytes() for w in resident),
+        }
+
+    # --------------------------------------------------------------------- #
+    #                               Spilling                                #
+    # --------------------------------------------------------------------- #
+
+    def spill_idle(self) -> int:
+        """Spill every unpinned workspace idle for > `idle_seconds`."""
+        now = time.monotonic()
+        with self._lock:
+            idle = [ws for ws in self._ws.values()
+                    if not ws.spilled and ws.pins == 0
+                    and now - ws.last_used > self.idle_seconds]
+        return sum(self._spill(ws) for ws in idle)
+
+    def _spill(self, ws: Workspace) -> bool:
+        """
+        Write `ws` to disk, then drop it from memory unless it was used
+        meanwhile (the files are simply rewritten on the next sweep).
+        """
+        with ws.io_lock:
+            with self._lock:
+                if ws.spilled or ws.pins:
+                    return False
+                stamp  = ws.last_used
+                frames = {name: getattr(ws, name) for name in Workspace._FRAMES}
+                feats, item_embs = ws.features, ws.item_embs
+                models = dict(ws.ft_models)
+
+            ws.path.mkdir(parents=True, exist_ok=True)
+            for name, df in frames.items():
+                f = ws.path / f"{name}.pkl"
+                if df is not None: df.to_pickle(f)
+                else:              f.unlink(missing_ok=True)
+            f = ws.path / "features.npz"
+            if feats is not None: np.savez(f, **feats.arrays())
+            else:                 f.unlink(missing_ok=True)
+            f = ws.path / "item_embs.npy"
+            if item_embs is not None: np.save(f, item_embs)
+            else:                     f.unlink(missing_ok=True)
+            for job_id, model in models.items():
+                own = {k: v for k, v in model.state_dict().items()
+                       if not k.startswith(self.shared_prefixes)}
+                torch.save(own, ws.path / f"ft_{job_id}.pth")
+
+            with self._lock:
+                if ws.pins or ws.last_used != stamp or ws.ft_models.keys() != models.keys():
+                    return False
+                for name in Workspace._FRAMES:
+                    setattr(ws, name, None)
+                ws.features   = None
+                ws.item_embs  = None
+                ws.ft_models  = {job_id: None for job_id in models}
+                ws.cache.clear()
+                ws.spilled = True
+        print(f"[workspace] spilled {ws.id} → {ws.path}")
+        return True
+
+    def _load(self, ws: Workspace) -> None:
+        """Caller holds `ws.io_lock` (not the store lock)."""
+        for name in Workspace._FRAMES:
+            f = ws.path / f"{name}.pkl"
+            setattr(ws, name, pd.read_pickle(f) if f.exists() else None)
+
+        f = ws.path / "features.npz"
+        ws.features = None
+        if f.exists():
+            with np.load(f) as z:
+                ws.features = FeatureStore(**{k: z[k] for k in z.files})
+        f = ws.path / "item_embs.npy"
+        ws.item_embs = np.load(f) if f.exists() else None
+
+        models = {}
+        for job_id in list(ws.ft_models):
+            model = self.model_factory()
+            own = torch.load(ws.path / f"ft_{job_id}.pth", map_location="cpu")
+            model.load_state_dict(own, strict=False)
+            model.eval()
+            models[job_id] = model
+
+        with self._lock:
+            ws.ft_models.update(models)
+            ws.spilled = False
+        print(f"[workspace] reloaded {ws.id}")
@@ -0,0 +1,70 @@
+# tests/conftest.py
+"""
+Shared synthetic fixtures: a small interaction frame shaped like the
+output of `Preprocessing`, its text embeddings, and an untrained model.
+Everything runs on CPU in a few seconds; no checkpoint or encoder needed.
+"""
+
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+import torch
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from backend.feature_store import FeatureStore
+from backend.model import HybridDeepFM
+from backend.training import META_COLS
+
+N_ROWS, N_USERS, N_ITEMS, SEQ_LEN, DIM = 2000, 120, 80, 20, 8
+
+
+@pytest.fixture(scope="session")
+def frame():
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame({
+        "u_idx":     rng.integers(0, N_USERS, N_ROWS),
+        "i_idx":     rng.integers(0, N_ITEMS, N_ROWS),
+        "click":     rng.integers(0, 2, N_ROWS),
+        "rating":    rng.integers(1, 6, N_ROWS),
+        "sentiment": rng.normal(size=N_ROWS).astype("float32"),
+    })
+    df["price_scaled"]     = df.i_idx * 0.1
+    df["category_encoded"] = df.i_idx % 7
+    df["color_encoded"]    = df.i_idx % 5
+    df["product_id"]       = "P" + df.i_idx.astype(str)
+    df["product_title"]    = "T" + df.i_idx.astype(str)
+
+    pad  = N_ITEMS
+    hist = df.groupby("u_idx")["i_idx"].apply(list).to_dict()
+    df["seq"] = df.u_idx.map(lambda u: ([pad] * SEQ_LEN + hist[u])[-SEQ_LEN:])
+    return df
+
+
+@pytest.fixture(scope="session")
+def emb(frame):
+    rng = np.random.default_rng(1)
+    i = frame.i_idx.to_numpy()
+    return {"review":        rng.normal(size=(len(frame), DIM)).astype("float32"),
+            "product_title": rng.normal(size=(N_ITEMS, DIM)).astype("float32")[i],
+            "features":      rng.normal(size=(N_ITEMS, DIM)).astype("float32")[i]}
+
+
+@pytest.fixture(scope="session")
+def struct_cols(frame):
+    return [c for c in META_COLS if c in frame.columns]
+
+
+@pytest.fixture(scope="session")
+def store(frame, emb, struct_cols):
+    return FeatureStore.from_frame(frame, emb, struct_cols)
+
+
+@pytest.fixture(scope="session")
+def model(store):
+    torch.manual_seed(0)
+    m = HybridDeepFM(N_USERS, N_ITEMS, 16, store.meta_dim, 32, SEQ_LEN)
+    return m.eval()
@@ -0,0 +1,68 @@
+# tests/test_cold_start.py
+import copy
+
+import numpy as np
+import pytest
+import torch
+
+from backend.cold_start import ColdStartTable, content_scores
+
+
+@pytest.fixture(scope="module")
+def table(frame, model, store):
+    return ColdStartTable.build(frame, model, store, version="base")
+
+
+def test_order_follows_blended_score(table, frame):
+    assert set(table.order.tolist()) == set(frame.i_idx.unique().tolist())
+    final = table.scores["final"][table.order]
+    assert (np.diff(final) <= 0).all()
+
+
+def test_content_signal_is_the_models_content_score(table, model, store):
+    items = table.order
+    assert np.allclose(table.scores["content"][items],
+                       content_scores(model, store.item_meta(items)))
+
+
+def test_categories_keep_the_global_order(table, frame):
+    cat = frame.groupby("i_idx")["category_encoded"].last()
+    rank = {int(i): r for r, i in enumerate(table.order)}
+    assert set(table.by_category) == set(cat.unique().tolist())
+    for c, items in table.by_category.items():
+        assert set(items.tolist()) == set(cat.index[cat == c].tolist())
+        assert all(rank[a] < rank[b] for a, b in zip(items[:-1], items[1:]))
+
+
+def test_top_k(table):
+    recs = table.top_k(5)
+    assert [r["item_id"] for r in recs] == table.order[:5].tolist()
+    assert recs[0]["asin"] == f"P{recs[0]['item_id']}"
+    assert recs[0]["final_score"] >= recs[-1]["final_score"]
+
+    skip = {recs[0]["item_id"]}
+    assert [r["item_id"] for r in table.top_k(4, exclude=skip)] == table.order[1:5].tolist()
+
+    c = next(iter(table.by_category))
+    assert [r["item_id"] for r in table.top_k(3, category=c)] == \
+        table.by_category[c][:3].tolist()
+    assert table.top_k(3, category=-1) == []
+
+
+def test_is_new(table, frame):
+    assert not table.is_new(int(frame.u_idx[0]))
+    assert table.is_new(frame.u_idx.max() + 1)
+
+
+def test_rebuild_reflects_a_fine_tuned_model(frame, model, store):
+    tuned = copy.deepcopy(model)
+    with torch.no_grad():
+        for p in tuned.cb.parameters():
+            p.add_(torch.randn_like(p))
+    only_content = {"content": 1.0}
+    base = ColdStartTable.build(frame, model, store, weights=only_content)
+    new  = ColdStartTable.build(frame, tuned, store, version="job", weights=only_content)
+    assert new.version == "job"
+    assert not np.array_equal(base.order, new.order)
+    content = new.scores["content"][new.order]
+    assert (np.diff(content) <= 0).all()
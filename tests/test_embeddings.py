@@ -0,0 +1,70 @@
+# tests/test_embeddings.py
+import numpy as np
+import pytest
+import torch
+
+from backend.model import (EMB_TABLES, HybridDeepFM, cached_embedding_tables,
+                           embedding_matrix, export_embedding_tables)
+from tests.conftest import N_ITEMS, N_USERS, SEQ_LEN
+
+
+def _compact(model, backend, **kw):
+    m = HybridDeepFM(N_USERS, N_ITEMS, 16, model.cb.fc[0].in_features, 32, SEQ_LEN,
+                     emb_backend=backend, **kw)
+    missing, _ = m.load_state_dict(model.state_dict(), strict=False)
+    assert not [k for k in missing if k.startswith("cf.")]
+    return m.eval()
+
+
+@pytest.mark.parametrize("name", EMB_TABLES)
+def test_int8_lookup_within_half_a_step(model, name):
+    dense = getattr(model.cf, name).weight.detach()
+    got = embedding_matrix(getattr(_compact(model, "int8").cf, name))
+    if dense.shape[1] == 1:                  # 1-wide bias tables fall back to fp16
+        assert torch.allclose(got, dense, rtol=1e-3, atol=1e-4)
+    else:
+        step = dense.abs().amax(dim=1, keepdim=True) / 127
+        assert ((got - dense).abs() <= step / 2 + 1e-7).all()
+
+
+@pytest.mark.parametrize("name", EMB_TABLES)
+def test_fp16_lookup_matches_dense(model, name):
+    dense = getattr(model.cf, name).weight.detach()
+    got = embedding_matrix(getattr(_compact(model, "fp16").cf, name))
+    assert torch.allclose(got, dense, rtol=1e-3, atol=1e-4)
+
+
+def test_compact_backends_score_like_dense(model, frame, store):
+    batch = {"u_idx": torch.tensor(frame.u_idx[:64].to_numpy()),
+             "i_idx": torch.tensor(frame.i_idx[:64].to_numpy()),
+             "seq":   torch.tensor(np.stack(frame.seq[:64])),
+             "meta":  torch.tensor(store.gather(np.arange(64), frame.i_idx[:64]))}
+    with torch.no_grad():
+        want = torch.sigmoid(model(batch)[0])
+        for backend in ("fp16", "int8"):
+            got = torch.sigmoid(_compact(model, backend)(batch)[0])
+            assert torch.allclose(got, want, atol=1e-2), backend
+
+
+def test_mmap_tables_are_exact(model, tmp_path):
+    d = export_embedding_tables(model.state_dict(), tmp_path)
+    m = _compact(model, "mmap", mmap_dir=d)
+    for name in EMB_TABLES:
+        assert torch.equal(embedding_matrix(getattr(m.cf, name)),
+                           getattr(model.cf, name).weight.detach())
+
+
+def test_cached_tables_follow_checkpoint_content(model, tmp_path):
+    ckpt = tmp_path / "ckpt.pth"
+    state = model.state_dict()
+    torch.save(state, ckpt)
+    first = cached_embedding_tables(state, ckpt, tmp_path / "cache")
+    assert cached_embedding_tables(state, ckpt, tmp_path / "cache") == first
+
+    changed = {k: v.clone() for k, v in state.items()}
+    changed["cf.item_emb.weight"] += 1.0                     # same shape, new weights
+    torch.save(changed, ckpt)
+    second = cached_embedding_tables(changed, ckpt, tmp_path / "cache")
+    assert second != first
+    assert np.array_equal(np.load(second / "item_emb.npy"),
+                          changed["cf.item_emb.weight"].numpy())
@@ -0,0 +1,40 @@
+# tests/test_evaluation.py
+import numpy as np
+import pytest
+
+from backend.evaluation import (RankingMetrics, build_histories, evaluate_ranking,
+                                leave_last_out_split, train_feature_store)
+from tests.conftest import N_ITEMS, SEQ_LEN
+
+
+def test_metric_values_by_hand():
+    m = RankingMetrics(ks=(2, 3), n_items=10)
+    m.update(np.array([[1, 2, 3],
+                       [4, 5, 6]]), [{2, 9}, {7}])
+    r = m.result()
+    # user 0: one of two relevant items at rank 2; user 1: no hit
+    assert r["recall@2"]   == pytest.approx(0.25)
+    assert r["hit_rate@3"] == pytest.approx(0.5)
+    assert r["ndcg@2"]     == pytest.approx((1 / np.log2(3)) / (1 + 1 / np.log2(3)) / 2)
+    assert r["coverage@2"] == pytest.approx(0.4)
+    assert r["coverage@3"] == pytest.approx(0.6)
+
+
+def test_padded_slots_never_hit_or_cover():
+    m = RankingMetrics(ks=(3,), n_items=5)
+    m.update(np.array([[0, -1, -1]]), [{4}])       # empty relevant slots are -1 too
+    r = m.result()
+    assert r["recall@3"] == 0 and r["ndcg@3"] == 0 and r["hit_rate@3"] == 0
+    assert r["coverage@3"] == pytest.approx(0.2)    # item 4 (= index -1) not covered
+
+
+def test_evaluate_ranking_uses_train_only_catalog(model, frame, emb, struct_cols):
+    train, test = leave_last_out_split(frame)
+    hist  = build_histories(train, SEQ_LEN, pad_token=N_ITEMS)
+    store = train_feature_store(frame, train, emb, struct_cols)
+    res = evaluate_ranking(model, hist, test, store, ks=(5, 10), n_negatives=20,
+                           log_every=0)
+    assert res["users"] + res["skipped_users"] == len(test)
+    for k in (5, 10):
+        assert 0 <= res[f"recall@{k}"] <= res[f"hit_rate@{k}"] <= 1
+    assert res["recall@5"] <= res["recall@10"]
@@ -0,0 +1,48 @@
+# tests/test_feature_store.py
+import numpy as np
+
+from backend.feature_store import FeatureStore
+from backend.training import build_meta_matrix
+
+
+def test_gather_matches_dense_matrix(frame, emb, struct_cols, store):
+    dense = build_meta_matrix(frame, emb, struct_cols)
+    rows = np.arange(len(frame))
+    assert store.shape == dense.shape
+    assert np.array_equal(store.gather(rows, frame.i_idx.to_numpy()), dense)
+
+
+def test_varying_column_is_kept_per_row(frame, emb, struct_cols):
+    df = frame.copy()
+    df["color_encoded"] = np.arange(len(df)) % 3          # colour of the variant bought
+    dense = build_meta_matrix(df, emb, struct_cols)
+    store = FeatureStore.from_frame(df, emb, struct_cols)
+
+    col = struct_cols.index("color_encoded")
+    assert col in store.row_dst and col not in store.item_dst
+    assert np.array_equal(store.gather(np.arange(len(df)), df.i_idx.to_numpy()), dense)
+
+
+def test_explicit_row_level_overrides_detection(frame, emb, struct_cols):
+    store = FeatureStore.from_frame(frame, emb, struct_cols, row_level={"review"})
+    assert len(store.row_dst) == emb["review"].shape[1]
+
+
+def test_item_meta_uses_latest_interaction(frame, emb, struct_cols, store):
+    dense = build_meta_matrix(frame, emb, struct_cols)
+    items = np.arange(store.item_feats.shape[0])
+    last = store.item_last_row[items]
+    assert np.array_equal(store.item_meta(items)[last >= 0], dense[last[last >= 0]])
+
+
+def test_float_noise_keeps_text_blocks_per_item(frame, emb, struct_cols):
+    rng = np.random.default_rng(2)
+    noisy = dict(emb)
+    noisy["product_title"] = emb["product_title"] + rng.normal(
+        scale=1e-7, size=emb["product_title"].shape).astype("float32")
+    dense = build_meta_matrix(frame, noisy, struct_cols)
+    store = FeatureStore.from_frame(frame, noisy, struct_cols)
+
+    assert len(store.row_dst) == 1 + emb["review"].shape[1]        # sentiment + review
+    assert np.allclose(store.gather(np.arange(len(frame)), frame.i_idx.to_numpy()),
+                       dense, rtol=0, atol=1e-5)
@@ -0,0 +1,49 @@
+# tests/test_jobs.py
+import threading
+import time
+
+import pytest
+
+from backend.jobs import JobRegistry
+
+
+def _wait(job, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while job.finished is None and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return job.status
+
+
+@pytest.fixture
+def release():
+    ev = threading.Event()
+    yield ev
+    ev.set()
+
+
+def test_training_does_not_starve_other_jobs(release):
+    jobs = JobRegistry(max_workers=2, kind_workers={"fine_tune": 1})
+    long = [jobs.submit("fine_tune", lambda j: release.wait(5)) for _ in range(3)]
+    while long[0].status == "queued":
+        time.sleep(0.01)
+    pre  = jobs.submit("preprocess", lambda j: "ok")
+    assert _wait(pre) == "done" and pre.result == "ok"
+    assert [j.status for j in long] == ["running", "queued", "queued"]
+    release.set()
+    assert all(_wait(j) == "done" for j in long)
+    jobs.shutdown()
+
+
+def test_failed_job_reports_error():
+    jobs = JobRegistry(max_workers=1)
+    job = jobs.submit("preprocess", lambda j: 1 / 0)
+    assert _wait(job) == "failed" and "ZeroDivisionError" in job.error
+    assert jobs.get(job.id).to_dict()["result"] is None
+    jobs.shutdown()
+
+
+def test_default_workers_read_at_construction(monkeypatch):
+    monkeypatch.setenv("RECOAI_JOB_WORKERS", "3")
+    jobs = JobRegistry()
+    assert jobs.executor._max_workers == 3
+    jobs.shutdown()
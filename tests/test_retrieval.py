@@ -0,0 +1,72 @@
+# tests/test_retrieval.py
+import numpy as np
+import pytest
+
+from backend.retrieval import CandidateRetriever, item_index, retrieval_recall
+from backend.top_k import _cf_item_scores, score_items
+
+
+@pytest.fixture(scope="module")
+def retriever(model, frame):
+    return CandidateRetriever(model, frame, n_embedding=15, n_neighbour=10,
+                              n_popular=5, top_n_users=5, like_threshold=4)
+
+
+def test_retrieve_respects_budgets_and_seen(retriever, frame):
+    for u, rows in list(frame.groupby("u_idx"))[:20]:
+        seen = set(rows.i_idx.tolist())
+        out = retriever.retrieve(int(u), rows.seq.iloc[-1], seen)
+        assert len(out) <= 15 + 10 + 5
+        assert len(out) == len(set(out))
+        assert not seen & set(out)
+
+
+def test_embedding_candidates_are_ranked_by_dot_product(retriever, model, frame):
+    u, seq = 3, frame.seq.iloc[0]
+    got = retriever.embedding_candidates(u, seq, n=10)
+    q = retriever._query(u, seq)
+    scores = item_index(model.cf.item_emb) @ q
+    want = retriever.item_ids[np.argsort(-scores[retriever.item_ids])[:10]]
+    assert np.array_equal(got, want)
+
+
+@pytest.mark.parametrize("top_n_users", [3, 5])
+def test_neighbour_scores_match_per_request_knn(retriever, frame, top_n_users):
+    for u in frame.u_idx.unique()[:25]:
+        got  = retriever.neighbour_item_scores(int(u), top_n_users)
+        want = _cf_item_scores(frame, int(u), 4, top_n_users)
+        assert got.keys() == want.keys()
+        assert all(abs(got[i] - want[i]) < 1e-9 for i in want)
+
+
+def test_item_index_is_shared(model):
+    assert item_index(model.cf.item_emb) is item_index(model.cf.item_emb)
+
+
+def _exhaustive_recall(model, retriever, frame, store, users, k):
+    seen_by_user = frame.groupby("u_idx")["i_idx"].agg(set)
+    seq_by_user  = frame.groupby("u_idx")["seq"].first()
+    catalog = np.sort(frame.i_idx.unique())
+    out = []
+    for u in users:
+        unseen = [int(i) for i in catalog if i not in seen_by_user[u]]
+        full = score_items(model, int(u), seq_by_user[u], unseen, store, store.meta_dim)
+        top = set(np.asarray(unseen)[np.argsort(-full)[:k]].tolist())
+        cands = set(retriever.retrieve(int(u), seq_by_user[u], seen_by_user[u]))
+        out.append(len(top & cands) / len(top))
+    return float(np.mean(out))
+
+
+def test_retrieval_recall_matches_exhaustive_scoring(model, frame, store, retriever):
+    users = frame.u_idx.unique()[:15]
+    res = retrieval_recall(model, retriever, frame, store, user_ids=users, k=10)
+    assert res["users"] == len(users)
+    assert res["recall_at_k"] == pytest.approx(
+        _exhaustive_recall(model, retriever, frame, store, users, 10))
+
+
+def test_retrieval_recall_is_one_when_budget_covers_catalog(model, frame, store):
+    full = CandidateRetriever(model, frame, n_embedding=0, n_neighbour=0,
+                              n_popular=frame.i_idx.nunique())
+    res = retrieval_recall(model, full, frame, store, k=10, max_users=10)
+    assert res["recall_at_k"] == 1.0
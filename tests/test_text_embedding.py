@@ -0,0 +1,31 @@
+# tests/test_text_embedding.py
+import pytest
+
+pytest.importorskip("sentence_transformers")
+
+from backend.text_embedding import DEFAULT_BATCH, EmbeddingPipeline, parse_field_map
+
+
+def test_parse_field_map():
+    assert parse_field_map("") == {}
+    assert parse_field_map(" review = a , features=b ") == {"review": "a", "features": "b"}
+    with pytest.raises(ValueError):
+        parse_field_map("review")
+
+
+def test_from_env_reads_every_variable_at_call_time(monkeypatch):
+    monkeypatch.setenv("RECOAI_EMBED_MODELS", "review=all-MiniLM-L6-v2")
+    monkeypatch.setenv("RECOAI_EMBED_BATCH", "review=8")
+    monkeypatch.setenv("RECOAI_EMBED_WORKERS", "3")
+    monkeypatch.setenv("RECOAI_EMBED_QUANTIZE", "1")
+    monkeypatch.setenv("RECOAI_EMBED_DTYPE", "float16")
+    p = EmbeddingPipeline.from_env(default_model=None)
+    assert p.field_models == {"review": "all-MiniLM-L6-v2"}
+    assert p.batch_sizes == {**DEFAULT_BATCH, "review": 8}
+    assert (p.n_workers, p.quantize, p.dtype.name) == (3, True, "float16")
+
+
+def test_constructor_ignores_the_environment(monkeypatch):
+    monkeypatch.setenv("RECOAI_EMBED_WORKERS", "3")
+    p = EmbeddingPipeline(default_model=None)
+    assert (p.n_workers, p.quantize, p.dtype.name) == (0, False, "float32")
@@ -0,0 +1,104 @@
+# tests/test_user_state.py
+import copy
+import gc
+
+import numpy as np
+import torch
+
+from backend.top_k import score_items
+from backend.user_state import MemoryBudget, UserStateCache
+
+
+def test_cached_state_scores_like_a_fresh_encode(model, frame, store):
+    cache = UserStateCache(model)
+    items = list(range(30))
+    for _, row in frame.head(5).iterrows():
+        u, seq = int(row.u_idx), row.seq
+        fresh  = score_items(model, u, seq, items, store, store.meta_dim)
+        cached = score_items(model, u, seq, items, store, store.meta_dim,
+                             cache.get(u, seq))
+        assert np.allclose(fresh, cached, atol=1e-6)
+
+
+def test_broadcast_history_matches_repeated_sequence(model, frame, store):
+    u, seq, items = int(frame.u_idx[0]), frame.seq[0], list(range(30))
+    with torch.no_grad():
+        preds, _ = model({"u_idx": torch.tensor([u] * len(items)),
+                          "i_idx": torch.tensor(items),
+                          "seq":   torch.tensor([seq] * len(items)),
+                          "meta":  torch.tensor(store.item_meta(items))})
+    want = torch.sigmoid(preds).numpy()
+    assert np.allclose(score_items(model, u, seq, items, store, store.meta_dim),
+                       want, atol=1e-6)
+
+
+def test_append_tracks_exact_encode(model, frame):
+    cache = UserStateCache(model, exact_every=100)
+    u, seq = int(frame.u_idx[0]), frame.seq[0]
+    st = cache.append(u, seq, [5])
+    assert st.seq == list(seq[1:]) + [5]
+    fresh = cache._encode(st.seq)
+    # only the dropped oldest item perturbs the state; recent steps agree
+    assert torch.allclose(st.gru_out[-1], fresh.gru_out[-1], atol=1e-3)
+    assert cache.get(u, seq) is st                     # session append kept
+
+
+def test_exact_every_reencodes(model, frame):
+    cache = UserStateCache(model, exact_every=2)
+    u, seq = int(frame.u_idx[0]), frame.seq[0]
+    st = cache.append(u, seq, [5, 7])
+    assert st.steps == 0
+    assert torch.equal(st.gru_out, cache._encode(st.seq).gru_out)
+
+
+def test_weight_load_invalidates_only_that_model(model, frame):
+    tenant = copy.deepcopy(model)
+    tenant.cf = model.cf                               # shared frozen tower
+    a, b = UserStateCache(model), UserStateCache(tenant)
+    u, seq = int(frame.u_idx[0]), frame.seq[0]
+    a.get(u, seq); b.get(u, seq)
+
+    tenant.load_state_dict(tenant.state_dict())
+    a.get(u, seq); b.get(u, seq)
+    assert a.stats()["hits"] == 1
+    assert b.stats()["hits"] == 0 and b.stats()["misses"] == 2
+
+
+def _users(frame, n):
+    first = frame.groupby("u_idx")["seq"].first()
+    return [(int(u), s) for u, s in first.head(n).items()]
+
+
+def test_cache_is_bounded_in_bytes(model, frame):
+    per_user = UserStateCache(model).get(*_users(frame, 1)[0]).nbytes
+    cache = UserStateCache(model, max_bytes=5 * per_user)
+    for u, seq in _users(frame, 20):
+        cache.get(u, seq)
+    assert len(cache) == 5 and cache.nbytes <= 5 * per_user
+    assert cache.stats()["evictions"] == 15
+
+
+def test_caches_share_one_budget(model, frame):
+    budget = MemoryBudget(0)
+    a, b = UserStateCache(model, budget=budget), UserStateCache(model, budget=budget)
+    users = _users(frame, 6)
+    for u, seq in users[:3]:
+        a.get(u, seq)
+    budget.max_bytes = a.nbytes
+    for u, seq in users[3:]:
+        b.get(u, seq)
+    assert budget.used == a.nbytes + b.nbytes
+    assert len(b) == 1                                  # b evicts its own users
+
+    del b; gc.collect()                                 # dropped caches give bytes back
+    assert budget.used == a.nbytes
+
+
+def test_append_does_not_mutate_a_served_state(model, frame):
+    cache = UserStateCache(model)
+    u, seq = int(frame.u_idx[0]), frame.seq[0]
+    served = cache.get(u, seq)
+    before = (list(served.seq), served.gru_out.clone())
+    cache.append(u, seq, [5])
+    assert served.seq == before[0] and torch.equal(served.gru_out, before[1])
+    assert cache.get(u, seq) is not served
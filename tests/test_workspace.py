@@ -0,0 +1,110 @@
+# tests/test_workspace.py
+import copy
+
+import numpy as np
+import pytest
+import torch
+
+from backend.workspace import WorkspaceStore
+
+
+@pytest.fixture
+def workspaces(model, tmp_path):
+    factory = lambda: copy.deepcopy(model, {id(model.cf): model.cf})
+    return WorkspaceStore(factory, root=tmp_path, idle_seconds=0)
+
+
+@pytest.fixture
+def head(model):
+    ft = copy.deepcopy(model, {id(model.cf): model.cf})
+    with torch.no_grad():
+        for name, p in ft.named_parameters():
+            if not name.startswith("cf."):
+                p.add_(0.5)
+    return ft.eval()
+
+
+def _fill(ws, frame, store, head):
+    ws.raw_df       = frame
+    ws.df_processed = frame
+    ws.features     = store
+    ws.item_embs    = store.item_feats[:, :4].copy()
+    ws.ft_models["job"] = head
+    ws.cache["meta"] = object()
+
+
+def test_spill_and_reload_round_trip(workspaces, frame, store, head):
+    ws = workspaces.create()
+    _fill(ws, frame, store, head)
+
+    assert workspaces.spill_idle() == 1
+    assert ws.spilled and ws.raw_df is None and ws.features is None
+    assert ws.ft_models == {"job": None} and not ws.cache
+    assert workspaces.stats()["resident"] == 0
+
+    assert workspaces.get(ws.id) is ws and not ws.spilled
+    assert ws.df_processed.equals(frame)
+    got, want = ws.features.arrays(), store.arrays()
+    assert all(np.array_equal(got[k], want[k]) for k in want)
+    assert np.array_equal(ws.item_embs, store.item_feats[:, :4])
+    reloaded = ws.ft_models["job"]
+    assert reloaded is not head and reloaded.cf is head.cf        # tower stays shared
+    want = head.state_dict()
+    assert all(torch.equal(v, want[k]) for k, v in reloaded.state_dict().items())
+
+
+def test_pinned_workspace_is_not_spilled(workspaces, frame, store, head):
+    ws = workspaces.create()
+    _fill(ws, frame, store, head)
+    with workspaces.use(ws.id):
+        assert workspaces.spill_idle() == 0
+        assert not ws.spilled and ws.raw_df is frame
+    assert workspaces.spill_idle() == 1
+
+
+def test_use_during_spill_write_keeps_data_resident(workspaces, frame, store, head,
+                                                   monkeypatch):
+    ws = workspaces.create()
+    _fill(ws, frame, store, head)
+    savez = np.savez
+
+    def _savez_then_request(*a, **kw):      # a request lands mid-write
+        savez(*a, **kw)
+        ws.touch()
+    monkeypatch.setattr("backend.workspace.np.savez", _savez_then_request)
+
+    assert workspaces.spill_idle() == 0
+    assert not ws.spilled and ws.raw_df is frame and ws.ft_models["job"] is head
+
+
+def test_use_reloads_a_spilled_workspace(workspaces, frame, store, head):
+    ws = workspaces.create()
+    _fill(ws, frame, store, head)
+    workspaces.spill_idle()
+    with workspaces.use(ws.id) as got:
+        assert got is ws and ws.pins == 1 and ws.raw_df is not None
+    assert ws.pins == 0
+
+
+def test_clear_models_drops_heads_and_spill_files(workspaces, frame, store, head):
+    ws = workspaces.create()
+    _fill(ws, frame, store, head)
+    workspaces.spill_idle()
+    workspaces.get(ws.id)
+    assert (ws.path / "ft_job.pth").exists()
+
+    ws.clear_models()
+    assert ws.ft_models == {} and ws.generation == 1
+    assert not (ws.path / "ft_job.pth").exists()
+    workspaces.spill_idle(); workspaces.get(ws.id)
+    assert ws.ft_models == {}
+
+
+def test_delete_removes_files(workspaces, frame, store, head):
+    ws = workspaces.create()
+    _fill(ws, frame, store, head)
+    workspaces.spill_idle()
+    workspaces.delete(ws.id)
+    assert not ws.path.exists()
+    with pytest.raises(KeyError):
+        workspaces.get(ws.id)